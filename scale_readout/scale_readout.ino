@@ -11,6 +11,11 @@ const int ON_REQUEST = 2;
 const int STREAM = 3;
 const int READ_DAQ_DELAY = 4;
 const int TARE = 5;
+const int STREAM_BINARY = 6;
+
+// Binary packets start with these two bytes
+const uint8_t SYNC_0 = 0xA5;
+const uint8_t SYNC_1 = 0x5A;
 
 const float calibration_factor = 8000; 
 
@@ -27,6 +32,19 @@ String daqDelayStr;
 // Keep track of last data acquistion for delays
 unsigned long timeOfLastDAQ = 0;
 
+// Sequence number of the next binary packet, lets the host spot lost packets
+uint16_t packetSeq = 0;
+
+// Fixed size binary packet, 13 bytes, little endian
+struct __attribute__((packed)) WeightPacket {
+  uint8_t sync0;
+  uint8_t sync1;
+  uint16_t seq;
+  uint32_t timeMilliseconds;
+  float weight;
+  uint8_t checksum;
+};
+
 
 // Useful functions
 
@@ -48,6 +66,30 @@ unsigned long printWeight() {
 }
 
 
+unsigned long writeWeightPacket() {
+  WeightPacket packet;
+  packet.sync0 = SYNC_0;
+  packet.sync1 = SYNC_1;
+  packet.seq = packetSeq++;
+  packet.weight = scale.get_units();
+  packet.timeMilliseconds = millis();
+
+  // Checksum is the byte sum of everything between the sync bytes and itself
+  uint8_t *bytes = (uint8_t *) &packet;
+  uint8_t checksum = 0;
+  for (unsigned int i = 2; i < sizeof(packet) - 1; i++) {
+    checksum += bytes[i];
+  }
+  packet.checksum = checksum;
+
+  if (Serial.availableForWrite() >= (int) sizeof(packet)) {
+    Serial.write(bytes, sizeof(packet));
+  }
+
+  return packet.timeMilliseconds;
+}
+
+
 void setup() {
   // Initialize serial communication
   Serial.begin(115200);
@@ -67,6 +109,11 @@ void loop() {
       timeOfLastDAQ = printWeight();
     }
   }
+  else if (daqMode == STREAM_BINARY) {
+    if (millis() - timeOfLastDAQ >= daqDelay) {
+      timeOfLastDAQ = writeWeightPacket();
+    }
+  }
 
   // Check if data has been sent to Arduino and respond accordingly
   if (Serial.available() > 0) {
@@ -84,6 +131,10 @@ void loop() {
       case STREAM:
         daqMode = STREAM;
         break;
+      case STREAM_BINARY:
+        packetSeq = 0;
+        daqMode = STREAM_BINARY;
+        break;
       case READ_DAQ_DELAY:
         // Read in delay, knowing it is appended with an x
         daqDelayStr = Serial.readStringUntil('x');
@@ -99,6 +150,9 @@ void loop() {
         break;
       case TARE:
 	      scale.tare();
+	      if (Serial.availableForWrite()) {
+	        Serial.println("Tare done.");
+	      }
 	      break;
     }
   }
@@ -0,0 +1,96 @@
+'''Edge cases of the serial parsers, which the simulator's random
+corruption only hits by chance.'''
+import numpy as np
+import pytest
+
+from parsing import ChunkParser, BinaryParser, SYNC, PACKET
+
+
+def packets(seq, time_ms=None, weight=None):
+    '''Well formed STREAM_BINARY packets.'''
+    seq = np.asarray(seq)
+    p = np.zeros(len(seq), dtype=PACKET)
+    p['sync'] = np.frombuffer(SYNC, dtype=np.uint8)
+    p['seq'] = seq % 65536
+    p['time_ms'] = 10 * seq if time_ms is None else time_ms
+    p['weight'] = seq / 4 if weight is None else weight
+    raw = p.view(np.uint8).reshape(len(p), PACKET.itemsize)
+    p['checksum'] = raw[:, 2:-1].sum(axis=1, dtype=np.uint8)
+    return p.tobytes()
+
+
+def feed_in_chunks(parser, data, size):
+    parts = [parser.feed(data[i:i + size]) for i in range(0, len(data), size)]
+    return np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts])
+
+
+def test_text_lines_split_across_chunks():
+    parser = ChunkParser()
+    time_ms, weight = parser.feed(b'100,1.5\r\n200,2.')
+    np.testing.assert_array_equal(time_ms, [100])
+    np.testing.assert_array_equal(weight, [1.5])
+    time_ms, weight = parser.feed(b'5\n300,-0.25\n')
+    np.testing.assert_array_equal(time_ms, [200, 300])
+    np.testing.assert_array_equal(weight, [2.5, -0.25])
+    assert time_ms.dtype == np.int64
+    assert parser.parsed == 3 and parser.malformed == 0
+
+
+def test_text_missing_field_and_inner_space_are_malformed():
+    # Bulk conversion would read these as the two samples (1, 2) and (3, 4)
+    parser = ChunkParser()
+    time_ms, weight = parser.feed(b'1,\n2 3,4\n')
+    assert len(time_ms) == 0 and len(weight) == 0
+    assert parser.malformed == 2
+
+
+@pytest.mark.parametrize('stamp', [b'1e3', b'1000.0'])
+def test_text_timestamp_must_be_an_integer(stamp):
+    parser = ChunkParser()
+    time_ms, weight = parser.feed(stamp + b',5.0\n2000,6.0\n')
+    np.testing.assert_array_equal(time_ms, [2000])
+    np.testing.assert_array_equal(weight, [6.0])
+    assert parser.malformed == 1
+
+
+def test_text_good_lines_around_a_bad_one():
+    parser = ChunkParser()
+    time_ms, weight = parser.feed(b'10,1.0\n20,garbage\n30,3.0\n')
+    np.testing.assert_array_equal(time_ms, [10, 30])
+    np.testing.assert_array_equal(weight, [1.0, 3.0])
+    assert parser.parsed == 2 and parser.malformed == 1
+
+
+@pytest.mark.parametrize('size', [1, 7, 1000])
+def test_binary_packets_in_any_chunk_size(size):
+    parser = BinaryParser()
+    time_ms, weight = feed_in_chunks(parser, packets(range(20)), size)
+    np.testing.assert_array_equal(time_ms, 10 * np.arange(20))
+    np.testing.assert_array_equal(weight, np.arange(20) / 4)
+    assert parser.parsed == 20 and parser.malformed == 0 and parser.lost == 0
+
+
+@pytest.mark.parametrize('size', [1, 7, 1000])
+def test_binary_resyncs_count_once_per_corrupt_stretch(size):
+    # A truncated packet followed by noise holding two stray sync
+    # markers, so one stretch takes several resyncs
+    noise = packets([5])[:6] + SYNC + b'\x00\x01\x02' + SYNC + b'\xff'
+    # A bad checksum, packet 12 is lost
+    bad = bytearray(packets([12]))
+    bad[-1] ^= 0xFF
+    data = packets(range(5)) + noise + packets(range(6, 12)) + bytes(bad) + packets(range(13, 20))
+    parser = BinaryParser()
+    time_ms, weight = feed_in_chunks(parser, data, size)
+    kept = [i for i in range(20) if i not in (5, 12)]
+    np.testing.assert_array_equal(time_ms, 10 * np.array(kept))
+    np.testing.assert_array_equal(weight, np.array(kept) / 4)
+    assert parser.malformed == 2
+    assert parser.lost == 2
+
+
+def test_binary_lost_counts_across_the_sequence_wraparound():
+    parser = BinaryParser()
+    parser.feed(packets([65534, 65535, 65536]))
+    assert parser.lost == 0
+    parser.feed(packets([65538]))
+    assert parser.lost == 1
@@ -0,0 +1,140 @@
+'''Publisher/Subscriber round trips on localhost.'''
+import time
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from pubsub import (HEADER, MAGIC, VERSION, Publisher, Subscriber, decode, encode,
+                    _recv_exact)
+
+# Frames big enough to fill the socket buffers of a client that isn't reading
+FRAME = 100000
+N_FRAMES = 10
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def frame(i):
+    '''A batch whose times all carry its number.'''
+    return np.full(FRAME, i), np.arange(FRAME, dtype=np.float64)
+
+
+def stalled_client(publisher):
+    '''A connected subscriber socket that doesn't read until told to.'''
+    sock = socket.socket(publisher.family, socket.SOCK_STREAM)
+    sock.connect(publisher.address)
+    wait_until(lambda: len(publisher.clients) == 1)
+    return sock
+
+
+def read_frames(sock, received):
+    '''Append the numbers of the frames received to `received` until the
+    publisher hangs up.'''
+    try:
+        while True:
+            magic, version, n = HEADER.unpack(_recv_exact(sock, HEADER.size))
+            time_ms, weight = decode(n, _recv_exact(sock, 12*n))
+            np.testing.assert_array_equal(weight, np.arange(FRAME))
+            received.append(int(time_ms[0]))
+    except (ConnectionError, OSError):
+        pass
+
+
+def publish_to_stalled(publisher):
+    '''Publish every frame while the only subscriber isn't reading, then
+    let it read what its queue kept. Returns the frame numbers it got and
+    its connection on the publisher's side.'''
+    sock = stalled_client(publisher)
+    client = publisher.clients[0]
+    for i in range(N_FRAMES):
+        publisher.publish(*frame(i))
+    received = []
+    reader = threading.Thread(target=read_frames, args=(sock, received))
+    reader.start()
+    wait_until(lambda: client.closed or client.sent + client.dropped == N_FRAMES * FRAME)
+    publisher.close()
+    reader.join(5)
+    sock.close()
+    return received, client
+
+
+@pytest.fixture
+def address(tmp_path):
+    return str(tmp_path / 'scale.sock')
+
+
+def test_encode_decode_round_trip():
+    time_ms = np.array([0, 1, 2**32 - 1], dtype=np.int64)
+    weight = np.array([-1.5, 0.0, 1e300])
+    data = encode(time_ms, weight)
+    magic, version, n = HEADER.unpack(data[:HEADER.size])
+    assert (magic, version, n) == (MAGIC, VERSION, 3)
+    assert len(data) == HEADER.size + 12*n
+    decoded_ms, decoded_w = decode(n, data[HEADER.size:])
+    np.testing.assert_array_equal(decoded_ms, time_ms)
+    np.testing.assert_array_equal(decoded_w, weight)
+
+
+@pytest.mark.parametrize('tcp', [False, True], ids=['unix', 'tcp'])
+def test_subscribers_receive_every_batch(address, tcp):
+    with Publisher('localhost:0' if tcp else address) as publisher:
+        target = publisher.sock.getsockname() if tcp else address
+        subscribers = [Subscriber(target) for _ in range(2)]
+        wait_until(lambda: len(publisher.clients) == 2)
+        batches = [(np.arange(i, i + 50), np.random.default_rng(i).normal(size=50)) for i in range(5)]
+        for time_ms, weight in batches:
+            publisher.publish(time_ms, weight)
+        wait_until(lambda: all(s.received == 250 for s in subscribers))
+        for subscriber in subscribers:
+            time_ms, weight = subscriber.drain()
+            np.testing.assert_array_equal(time_ms, np.concatenate([t for t, _ in batches]))
+            np.testing.assert_array_equal(weight, np.concatenate([w for _, w in batches]))
+            assert subscriber.dropped == 0
+    for subscriber in subscribers:
+        wait_until(lambda: not subscriber.connected)
+        subscriber.close()
+
+
+def test_drop_oldest_keeps_the_latest(address):
+    with Publisher(address, maxlen=2, policy='drop_oldest') as publisher:
+        received, client = publish_to_stalled(publisher)
+    assert received[-2:] == [N_FRAMES - 2, N_FRAMES - 1]
+    assert received == sorted(received)
+    assert client.dropped == (N_FRAMES - len(received)) * FRAME > 0
+
+
+def test_drop_newest_keeps_the_first(address):
+    with Publisher(address, maxlen=2, policy='drop_newest') as publisher:
+        received, client = publish_to_stalled(publisher)
+    assert received == list(range(len(received)))
+    assert client.dropped == (N_FRAMES - len(received)) * FRAME > 0
+
+
+def test_block_loses_nothing(address):
+    with Publisher(address, maxlen=1, policy='block', block_timeout=10) as publisher:
+        subscriber = Subscriber(address, maxlen=N_FRAMES * FRAME)
+        wait_until(lambda: len(publisher.clients) == 1)
+        for i in range(N_FRAMES):
+            publisher.publish(*frame(i))
+        wait_until(lambda: subscriber.received == N_FRAMES * FRAME)
+        assert publisher.stats()[0]['dropped'] == 0
+    time_ms, _ = subscriber.drain()
+    np.testing.assert_array_equal(time_ms[::FRAME], np.arange(N_FRAMES))
+    subscriber.close()
+
+
+def test_disconnect_drops_a_slow_subscriber(address):
+    with Publisher(address, maxlen=2, policy='disconnect') as publisher:
+        received, client = publish_to_stalled(publisher)
+        # and forgotten by the batches published after that
+        assert publisher.clients == []
+    assert client.closed
+    assert len(received) < N_FRAMES
+    assert client.dropped > 0
@@ -0,0 +1,112 @@
+'''Run a SimulatedScale through the whole acquisition and storage
+pipeline, as a hardware-free load test.'''
+import time
+
+import numpy as np
+import pytest
+
+from scale_core import Scale
+from simulator import SimulatedScale
+from decimate import MinMaxDecimator
+from session_writer import SessionWriter
+from session_reader import SessionReader
+from catalog import Catalog
+
+# 40 s of repeaters (pulls start at 2, 12, 22 and 32 s) at 100 Hz, run
+# 40 times faster than real time
+DURATION = 40
+RATE = 100
+SPEED = 40
+CORRUPT = 0.01
+
+
+def record(data_file, binary):
+    device = SimulatedScale(sample_rate=RATE, speed=SPEED, corrupt=CORRUPT, timeout=0.05, seed=1)
+    scale = Scale(None, 0, dt=1 / RATE)
+    scale.set_arduino(device)
+    scale.set_binary(binary)
+    scale.connect()
+    scale.writer = SessionWriter(data_file, '18-10-2026/12:0:0', attrs={'name': 'sim'},
+                                 catalog=Catalog(data_file))
+    scale.start_reader(delay=10)
+    frames = scale.reader_stream()
+    while device.millis() < DURATION * 1000:
+        time.sleep(0.02)
+        scale.update(next(frames))
+    scale.stop_reader()
+    # Whatever the reader had not taken yet
+    scale.update(scale.reader.drain())
+    scale.update(scale.parser.feed(device.read_all()))
+    scale.writer.close(attrs=scale.reader.stats())
+    return scale, device
+
+
+@pytest.fixture(scope='module', params=[False, True], ids=['text', 'binary'])
+def session(request, tmp_path_factory):
+    data_file = str(tmp_path_factory.mktemp('sim') / 'data.hdf5')
+    scale, device = record(data_file, request.param)
+    return request.param, data_file, scale, device
+
+
+def test_parsers_account_for_every_sample(session):
+    binary, _, scale, device = session
+    parser = scale.parser
+    assert parser.malformed > 0
+    assert scale.samples.total == parser.parsed
+    if binary:
+        # Corrupt packets show up as sequence gaps, except a last one
+        assert device.n_sent - 1 <= parser.parsed + parser.lost <= device.n_sent
+        assert parser.malformed <= parser.lost
+    else:
+        assert parser.parsed + parser.malformed == device.n_sent
+    assert parser.parsed > 0.95 * DURATION * RATE
+
+
+def test_samples_are_ordered(session):
+    _, _, scale, _ = session
+    assert len(scale.samples) == scale.samples.total
+    assert np.all(np.diff(scale.samples.ms) > 0)
+    np.testing.assert_allclose(scale.tdata, (scale.samples.ms - scale.samples.ms[0]) / 1000)
+
+
+def test_decimator_keeps_extremes(session):
+    _, _, scale, _ = session
+    decimator = MinMaxDecimator(width=0.5)
+    for start in range(0, len(scale.tdata), 333):
+        decimator.extend(scale.tdata[start:start + 333], scale.wdata[start:start + 333])
+    assert len(decimator) <= 2 * (scale.tdata[-1] // 0.5 + 1)
+    assert decimator.hi.w.max() == scale.wdata.max()
+    assert decimator.lo.w.min() == scale.wdata.min()
+
+
+def test_session_is_stored_and_catalogued(session):
+    _, data_file, scale, _ = session
+    entry = Catalog(data_file).latest(complete=True)
+    assert entry['path'] == '18-10-2026/12:0:0'
+    assert entry['n_samples'] == scale.samples.total
+    assert entry['name'] == 'sim'
+    with SessionReader(data_file) as reader:
+        stored = reader.session(entry['path'])
+        assert stored.attrs['complete']
+        np.testing.assert_array_equal(stored.wdata[:], scale.wdata)
+        np.testing.assert_array_equal(stored.grp['time_ms'][:], scale.samples.ms)
+
+
+def test_summary_and_reps(session):
+    _, data_file, scale, _ = session
+    summary = scale.writer.summary
+    reps = scale.writer.reps
+    assert summary['peak_force'] == pytest.approx(40, abs=0.5)
+    assert summary['max_rfd'] > 0 > summary['min_rfd']
+    assert summary['max_rfd_index'] < summary['min_rfd_index']
+    assert 0 < summary['hold_duration'] <= 7.5
+    assert summary['impulse'] > 0
+
+    assert len(reps) == 4
+    # Session times start at the first sample, the profile's at the boot
+    t_first = scale.samples.ms[0] / 1000
+    np.testing.assert_allclose(reps['t_start'] + t_first, [2, 12, 22, 32], atol=0.1)
+    np.testing.assert_allclose(reps['duration'], 7, atol=0.5)
+    np.testing.assert_allclose(reps['peak_force'], 40, atol=0.5)
+    with SessionReader(data_file) as reader:
+        np.testing.assert_array_equal(reader.session('18-10-2026/12:0:0').grp['reps'][:], reps)
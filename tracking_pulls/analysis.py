@@ -0,0 +1,294 @@
+import numpy as np
+
+# Bump when the metrics below change, so cached summaries get recomputed
+SUMMARY_VERSION = 4
+
+SUMMARY_KEYS = (
+    'peak_force', 'time_to_peak', 'max_rfd', 'min_rfd', 'max_rfd_index',
+    'min_rfd_index', 'impulse', 'hold_duration',
+)
+
+
+def _fit_derivatives(tdata, wdata, window, order, chunk_size=8192):
+    '''Local polynomial fits of one session, `chunk_size` samples at a
+    time so the fit arrays stay small whatever the session length.'''
+    n = len(tdata)
+    first = np.zeros(n)
+    second = np.zeros(n)
+    half = window // 2
+    for i in range(0, n, chunk_size):
+        # Start of each sample's window, shifted inwards at the ends
+        starts = np.clip(np.arange(i, min(i + chunk_size, n)) - half, 0, n - window)
+        idx = starts[:, None] + np.arange(window)
+
+        # Fit y = sum c_k dx^k about each sample, via the normal equations
+        dx = tdata[idx] - tdata[i:i + len(starts), None]
+        V = dx[:, :, None] ** np.arange(order + 1)
+        VT = V.transpose(0, 2, 1)
+        coeffs = np.linalg.solve(VT @ V, VT @ wdata[idx][:, :, None])[:, :, 0]
+        first[i:i + len(starts)] = coeffs[:, 1]
+        if order >= 2:
+            second[i:i + len(starts)] = 2*coeffs[:, 2]
+    return first, second
+
+
+def _session_derivatives(tdata, wdata, window, order):
+    n = len(tdata)
+    # Shrink the window if the session is too short for it
+    window = min(window, n)
+    order = min(order, window - 1)
+    if order < 1:
+        return np.zeros(n), np.zeros(n)
+    dt = np.diff(tdata)
+    if window % 2 and dt[0] > 0 and np.allclose(dt, dt[0], rtol=1e-6, atol=0):
+        # Uniform sampling, the same fits as a Savitzky-Golay filter
+        from scipy.signal import savgol_filter
+        first = savgol_filter(wdata, window, order, deriv=1, delta=dt[0], mode='interp')
+        if order < 2:
+            return first, np.zeros(n)
+        return first, savgol_filter(wdata, window, order, deriv=2, delta=dt[0], mode='interp')
+    return _fit_derivatives(tdata, wdata, window, order)
+
+
+def smoothed_derivatives(tdata, wdata, window=7, order=2, lengths=None):
+    '''Smoothed first and second derivatives of w(t).
+
+    A Savitzky-Golay style filter: around every sample a polynomial of
+    degree `order` is least-squares fitted to the `window` nearest samples
+    and differentiated at that sample. The fits use the actual times, so
+    non-uniform device timestamps are handled, and near the ends of the
+    trace the window is shifted inwards rather than padded. Uniformly
+    sampled traces go through `scipy.signal.savgol_filter`, others are
+    fitted in chunks, so memory stays proportional to the input. Several
+    sessions can be evaluated in one call by concatenating them and
+    passing their `lengths`; windows never cross a session boundary and
+    only sessions shorter than `window` get a smaller one.
+    Returns arrays the same length as the input.'''
+    tdata = np.asarray(tdata, dtype=np.float64)
+    wdata = np.asarray(wdata, dtype=np.float64)
+    n = len(tdata)
+    if lengths is None:
+        lengths = [n]
+    first = np.zeros(n)
+    second = np.zeros(n)
+    start = 0
+    for length in lengths:
+        stop = start + length
+        if length:
+            first[start:stop], second[start:stop] = _session_derivatives(
+                tdata[start:stop], wdata[start:stop], window, order)
+        start = stop
+    return first, second
+
+
+def batch_derivatives(sessions, window=7, order=2):
+    '''`smoothed_derivatives` for a list of (tdata, wdata) sessions.
+    Returns a list of (first, second) pairs.'''
+    return [smoothed_derivatives(t, w, window, order) for t, w in sessions]
+
+
+def empty_summary():
+    '''Summary of a session too short to have one. The indices are 0, so
+    they still slice (to nothing).'''
+    summary = {key: np.nan for key in SUMMARY_KEYS}
+    summary['max_rfd_index'] = summary['min_rfd_index'] = 0
+    return summary
+
+
+def summary_metrics(tdata, wdata, reps=None):
+    '''Summary features of a single pull.
+
+    Rate of force development (RFD) is the slope of the weight trace. The
+    pull is taken to run from the steepest rise to the steepest drop after
+    it, and `impulse` is the area under the curve over that window. With
+    the session's `reps` table the drop is looked for within the rep of the
+    steepest rise, so another rep's release is never picked, and
+    `time_to_peak` is timed from the start of the rep holding the peak
+    rather than from the start of the recording.'''
+    tdata = np.asarray(tdata, dtype=np.float64)
+    wdata = np.asarray(wdata, dtype=np.float64)
+    if len(wdata) < 2:
+        return empty_summary()
+    slope, _ = smoothed_derivatives(tdata, wdata)
+    peak_index = np.argmax(wdata)
+    max_index = int(np.argmax(slope))
+    end = len(slope)
+    t_start = tdata[0]
+    if reps is not None:
+        for rep in reps:
+            if rep['start_index'] <= max_index < rep['end_index']:
+                # The rep ends at the first sample after its release
+                end = min(int(rep['end_index']) + 1, len(slope))
+                break
+        for rep in reps:
+            if rep['start_index'] <= peak_index < rep['end_index']:
+                t_start = rep['t_start']
+                break
+    min_index = max_index + int(np.argmin(slope[max_index:end]))
+    t, w = tdata[max_index:min_index + 1], wdata[max_index:min_index + 1]
+    return {
+        'peak_force': wdata[peak_index],
+        'time_to_peak': tdata[peak_index] - t_start,
+        'max_rfd': slope[max_index],
+        'min_rfd': slope[min_index],
+        'max_rfd_index': max_index,
+        'min_rfd_index': min_index,
+        'impulse': np.sum((w[1:] + w[:-1]) / 2 * np.diff(t)),
+        'hold_duration': tdata[min_index] - tdata[max_index],
+    }
+
+
+def session_times(grp):
+    '''Sample times of a stored session, synthesized from the nominal
+    sample rate for sessions recorded before `tdata` was saved.'''
+    if 'tdata' in grp:
+        return grp['tdata'][:]
+    if 'sample_rate' in grp.attrs:
+        sample_rate = grp.attrs['sample_rate']
+    elif 'sample_rate' in grp:
+        sample_rate = grp['sample_rate'][()]
+    else:
+        sample_rate = 10
+    return np.arange(len(grp['wdata'])) / sample_rate
+
+
+def session_reps(grp):
+    '''The stored `reps` table of a session, or a freshly segmented one.'''
+    if 'reps' in grp:
+        return grp['reps'][:]
+    # segmentation imports this module
+    from segmentation import segment_pulls
+    return segment_pulls(session_times(grp), grp['wdata'])
+
+
+def write_summary(grp, summary=None):
+    '''Store summary metrics as attributes of a session group.'''
+    if summary is None:
+        summary = summary_metrics(session_times(grp), grp['wdata'][:], session_reps(grp))
+    for key, value in summary.items():
+        grp.attrs[key] = value
+    grp.attrs['summary_version'] = SUMMARY_VERSION
+    return summary
+
+
+def load_summary(grp):
+    '''Summary metrics of a session group, computed and cached in the
+    group on first use if it predates them (and the file is writable).'''
+    if grp.attrs.get('summary_version') == SUMMARY_VERSION:
+        return {key: grp.attrs[key] for key in SUMMARY_KEYS}
+    if 'wdata' not in grp:
+        return empty_summary()
+    summary = summary_metrics(session_times(grp), grp['wdata'][:], session_reps(grp))
+    if grp.file.mode == 'r+':
+        write_summary(grp, summary)
+    return summary
+
+
+class OnlineAnalytics:
+    '''Pull metrics updated in O(1) per sample during acquisition.
+
+    Keeps the running peak, an exponentially smoothed slope (time constant
+    `tau` seconds) with its extremes, an exponentially weighted mean and
+    variance of the weight, and detects pull onset and release with
+    hysteresis: a pull starts when the weight rises `on_threshold` above
+    the resting baseline and ends when it falls back below `off_threshold`
+    above it.'''
+    def __init__(self, tau=0.2, on_threshold=2.0, off_threshold=1.0):
+        self.tau = tau
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.t_last = None
+        self.w_last = None
+        self.peak = -np.inf
+        self.t_peak = None
+        self.slope = 0.0
+        self.max_rfd = -np.inf
+        self.min_rfd = np.inf
+        self.t_max_rfd = None
+        self.t_min_rfd = None
+        self.mean = 0.0
+        self.var = 0.0
+        self.baseline = 0.0
+        self.pulling = False
+        self.t_onset = None
+        self.t_release = None
+        # Peak of the latest pull, reset at each onset
+        self.pull_peak = -np.inf
+        self.t_pull_peak = None
+        self.impulse = 0.0
+        self.pulls = 0
+
+    def update(self, tdata, wdata):
+        '''Feed a batch of samples.'''
+        for t, w in zip(np.asarray(tdata, dtype=np.float64), np.asarray(wdata, dtype=np.float64)):
+            self._step(t, w)
+
+    def _step(self, t, w):
+        self.n += 1
+        if self.t_last is None:
+            self.t_last, self.w_last = t, w
+            self.mean = self.baseline = w
+            self.peak, self.t_peak = w, t
+            return
+        dt = t - self.t_last
+        if dt <= 0:
+            return
+        alpha = 1 - np.exp(-dt / self.tau)
+
+        # Smoothed slope and its extremes
+        self.slope += alpha * ((w - self.w_last) / dt - self.slope)
+        if self.slope > self.max_rfd:
+            self.max_rfd, self.t_max_rfd = self.slope, t
+        if self.slope < self.min_rfd:
+            self.min_rfd, self.t_min_rfd = self.slope, t
+
+        # Exponentially weighted mean and variance
+        delta = w - self.mean
+        self.mean += alpha * delta
+        self.var = (1 - alpha) * (self.var + alpha * delta**2)
+
+        if w > self.peak:
+            self.peak, self.t_peak = w, t
+
+        # Onset/release with hysteresis, the baseline tracks the weight at rest
+        if self.pulling:
+            self.impulse += (w + self.w_last) / 2 * dt
+            if w > self.pull_peak:
+                self.pull_peak, self.t_pull_peak = w, t
+            if w < self.baseline + self.off_threshold:
+                self.pulling = False
+                self.t_release = t
+        else:
+            if w > self.baseline + self.on_threshold:
+                self.pulling = True
+                self.pulls += 1
+                self.t_onset = t
+                self.t_release = None
+                self.pull_peak, self.t_pull_peak = w, t
+            else:
+                self.baseline += alpha * (w - self.baseline)
+
+        self.t_last, self.w_last = t, w
+
+    def summary(self):
+        '''Metrics so far. `peak_force`, `max_rfd` and `min_rfd` match the
+        keys of `summary_metrics`, while the onset based metrics are named
+        apart since they differ from the stored ones: `pull_time_to_peak`
+        and `pull_duration` refer to the latest pull and `pull_impulse`
+        sums over all pulls.'''
+        end = self.t_release if self.t_release is not None else self.t_last
+        return {
+            'peak_force': self.peak,
+            'max_rfd': self.max_rfd,
+            'min_rfd': self.min_rfd,
+            'pull_time_to_peak': self.t_pull_peak - self.t_onset if self.t_onset is not None else np.nan,
+            'pull_impulse': self.impulse,
+            'pull_duration': end - self.t_onset if self.t_onset is not None else 0.0,
+            'pulls': self.pulls,
+            'mean': self.mean,
+            'std': np.sqrt(self.var),
+        }
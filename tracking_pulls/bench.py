@@ -0,0 +1,170 @@
+'''Throughput and latency benchmark of the acquisition and plotting pipeline.
+
+Drives `Scale` with a `SimulatedScale` at increasing sample rates and
+session lengths and reports, per case, the sustained samples/s, per frame
+`update` times, latency from device timestamp to drawn frame, memory
+growth and dropped samples. Results are written as JSON so runs can be
+compared, e.g.
+
+    python bench.py --rates 100 1000 10000 --durations 5 20 -o new.json
+    python bench.py --baseline old.json -o new.json
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from scale_core import Scale
+from simulator import SimulatedScale
+
+
+def rss_mb():
+    '''Resident memory of this process in MB.'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2**20
+    except OSError:
+        import resource
+        # Peak rather than current on platforms without /proc
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
+
+def percentiles(x, q=(50, 95, 99)):
+    x = np.asarray(x, dtype=np.float64)
+    if len(x) == 0:
+        return {f'p{p}': None for p in q} | {'max': None}
+    values = np.percentile(x, q)
+    return {f'p{p}': float(v) for p, v in zip(q, values)} | {'max': float(x.max())}
+
+def run_case(rate, duration, source='reader', binary=False, window=None,
+             frame_interval=0.05, seed=0):
+    '''Stream `duration` seconds at `rate` samples/s through one `Scale`
+    and plot, returning the measurements as a dict.'''
+    device = SimulatedScale(sample_rate=rate, timeout=0.1, seed=seed)
+    fig, ax = plt.subplots()
+    scale = Scale(ax, 10, window=window)
+    scale.set_arduino(device)
+    scale.set_binary(binary)
+    scale.connect()
+    fig.canvas.draw()
+
+    update_times = []
+    latencies = []
+    memory = []
+    rss_start = rss_mb()
+    if source == 'reader':
+        scale.start_reader(delay=1)
+        frames = scale.reader_stream()
+    else:
+        frames = scale.daq_stream(delay=1)
+
+    start = time.perf_counter()
+    next_memory = start
+    while True:
+        now = time.perf_counter()
+        if now - start >= duration:
+            break
+        if now >= next_memory:
+            memory.append((now - start, rss_mb()))
+            next_memory += 0.5
+        time_ms, w = next(frames)
+        tic = time.perf_counter()
+        scale.update((time_ms, w))
+        toc = time.perf_counter()
+        update_times.append(toc - tic)
+        if len(time_ms):
+            # The simulated board's clock started at `device.t_start`
+            latencies.append(toc - (device.t_start + time_ms[-1] / 1000 / device.speed))
+        if source == 'reader':
+            # Pace like the GUI timer, the reader thread keeps acquiring
+            time.sleep(max(0, frame_interval - (time.perf_counter() - now)))
+    elapsed = time.perf_counter() - start
+
+    if source == 'reader':
+        scale.stop_reader()
+        stats = scale.reader.stats()
+    else:
+        device.write(bytes([scale.ON_REQUEST]))
+        stats = {'received': scale.samples.total, 'dropped': 0,
+                 'malformed': scale.parser.malformed,
+                 'lost': getattr(scale.parser, 'lost', 0)}
+    plt.close(fig)
+    memory.append((elapsed, rss_mb()))
+
+    plotted = scale.samples.total
+    return {
+        'rate': rate,
+        'duration': duration,
+        'source': source,
+        'binary': binary,
+        'window': window,
+        'samples': plotted,
+        'samples_per_s': plotted / elapsed,
+        'generated': device.n_sent,
+        'frames': len(update_times),
+        'update_ms': {k: v and v * 1000 for k, v in percentiles(update_times).items()},
+        'latency_ms': {k: v and v * 1000 for k, v in percentiles(latencies).items()},
+        'rss_start_mb': rss_start,
+        'rss_growth_mb': memory[-1][1] - rss_start,
+        'memory_mb': [(round(t, 2), round(m, 2)) for t, m in memory],
+        'dropped': stats['dropped'],
+        'malformed': stats['malformed'],
+        'lost': stats['lost'],
+        'behind': device.n_sent - stats['received'],
+    }
+
+def compare(results, baseline):
+    '''Print the change of the headline numbers against an earlier run.'''
+    old = {(r['rate'], r['duration'], r['source'], r['binary']): r for r in baseline['cases']}
+    for r in results['cases']:
+        b = old.get((r['rate'], r['duration'], r['source'], r['binary']))
+        if b is None:
+            continue
+        print(f"{r['rate']:>8} Hz {r['duration']:>5} s: "
+              f"samples/s {r['samples_per_s'] / b['samples_per_s'] - 1:+.1%}, "
+              f"update p95 {r['update_ms']['p95'] / b['update_ms']['p95'] - 1:+.1%}, "
+              f"dropped {r['dropped'] - b['dropped']:+d}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rates', type=float, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--durations', type=float, nargs='+', default=[5, 20])
+    parser.add_argument('--source', choices=['reader', 'stream'], default='reader',
+                        help='background SerialReader, or daq_stream on the plotting thread')
+    parser.add_argument('--binary', action='store_true', help='use STREAM_BINARY packets')
+    parser.add_argument('--window', type=float, help='scrolling plot window in seconds')
+    parser.add_argument('-o', '--output', help='write the JSON results here (default stdout)')
+    parser.add_argument('--baseline', help='earlier JSON results to compare against')
+    args = parser.parse_args(argv)
+
+    cases = []
+    for duration in args.durations:
+        for rate in args.rates:
+            print(f'{rate:g} Hz for {duration:g} s...', file=sys.stderr)
+            cases.append(run_case(rate, duration, args.source, args.binary, args.window))
+    results = {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'matplotlib': matplotlib.__version__,
+        'platform': platform.platform(),
+        'cases': cases,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    else:
+        json.dump(results, sys.stdout, indent=1)
+        print()
+    if args.baseline:
+        with open(args.baseline) as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+import os
+import re
+import json
+import datetime
+
+import numpy as np
+import h5py as hp
+
+# Fields that can be looked up through an index in `Catalog.query`
+INDEXED = ('name', 'arm_used', 'hold_size_mm')
+
+
+def group_start_time(path):
+    '''Best effort start time from a `day-month-year/hour:min:sec` group
+    path. Older sessions wrote a mangled minute field, which reads as 0.'''
+    match = re.match(r'(\d+)-(\d+)-(\d+)/(\d+):(.*):(\d+)$', path)
+    if match is None:
+        return None
+    day, month, year, hour, minute, second = match.groups()
+    minute = int(minute) if minute.isdigit() else 0
+    return datetime.datetime(int(year), int(month), int(day), int(hour), minute, int(second)).timestamp()
+
+
+def _meta(grp, key):
+    '''Session metadata lives in attributes, or in scalar datasets for
+    the oldest sessions.'''
+    if key in grp.attrs:
+        value = grp.attrs[key]
+    elif key in grp and grp[key].shape == ():
+        value = grp[key][()]
+    else:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode()
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _hold_size(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def session_entry(path, grp):
+    '''Catalog entry for the session stored in `grp`.'''
+    n_samples = len(grp['wdata']) if 'wdata' in grp else 0
+    if 'peak_force' in grp.attrs:
+        peak = float(grp.attrs['peak_force'])
+    else:
+        peak = float(np.max(grp['wdata'])) if n_samples else None
+    if 'tdata' in grp and n_samples > 1:
+        tdata = grp['tdata']
+        duration = float(tdata[-1] - tdata[0])
+    else:
+        sample_rate = _meta(grp, 'sample_rate') or 10
+        duration = n_samples / sample_rate
+    start_time = _meta(grp, 'start_time') or group_start_time(path)
+    complete = _meta(grp, 'complete')
+    return {
+        'path': path,
+        'name': _meta(grp, 'name'),
+        'arm_used': _meta(grp, 'arm_used'),
+        'hold_size_mm': _hold_size(_meta(grp, 'hold_size_mm')),
+        'start_time': start_time,
+        'duration': duration,
+        'peak_weight': peak,
+        'n_samples': n_samples,
+        'complete': True if complete is None else bool(complete),
+    }
+
+
+class Catalog:
+    '''Index of the sessions in an HDF5 store, cached next to it.
+
+    The cache lives in `<data file>.catalog.json`. `SessionWriter` adds
+    entries as sessions are saved; `refresh` picks up anything written by
+    other means, only opening groups that are not catalogued yet.'''
+    def __init__(self, data_file):
+        self.data_file = data_file
+        self.cache_file = data_file + '.catalog.json'
+        self.entries = {}
+        self.index = {}
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file) as f:
+                cached = json.load(f)
+            for entry in cached['sessions']:
+                self._add(entry)
+            if cached.get('mtime') != self._mtime():
+                try:
+                    self.refresh()
+                except OSError:
+                    # Locked by a session being recorded, the cache will do
+                    pass
+        elif os.path.exists(data_file):
+            self.refresh()
+
+    def _mtime(self):
+        return os.path.getmtime(self.data_file) if os.path.exists(self.data_file) else None
+
+    def _add(self, entry):
+        self.entries[entry['path']] = entry
+        for key in INDEXED:
+            self.index.setdefault(key, {}).setdefault(entry[key], set()).add(entry['path'])
+
+    def _remove(self, path):
+        entry = self.entries.pop(path)
+        for key in INDEXED:
+            self.index[key][entry[key]].discard(path)
+
+    def refresh(self):
+        '''Bring the catalog in line with the data file.'''
+        with hp.File(self.data_file, 'r') as hfile:
+            paths = [f'{day}/{session}' for day in hfile for session in hfile[day]]
+            for path in set(self.entries) - set(paths):
+                self._remove(path)
+            for path in paths:
+                if path not in self.entries:
+                    self._add(session_entry(path, hfile[path]))
+                elif not self.entries[path]['complete']:
+                    # May have been recording when last catalogued
+                    self._remove(path)
+                    self._add(session_entry(path, hfile[path]))
+        self.save()
+
+    def add(self, entry):
+        '''Record a newly written session and update the cache.'''
+        if entry['path'] in self.entries:
+            self._remove(entry['path'])
+        self._add(entry)
+        self.save()
+
+    def save(self):
+        with open(self.cache_file, 'w') as f:
+            json.dump({'mtime': self._mtime(), 'sessions': list(self.entries.values())}, f, indent=1)
+
+    def query(self, **filters):
+        '''Sessions matching every `field=value` filter, oldest first.'''
+        paths = None
+        for key, value in filters.items():
+            if key in INDEXED:
+                if key == 'hold_size_mm':
+                    value = _hold_size(value)
+                matches = self.index.get(key, {}).get(value, set())
+            else:
+                matches = {p for p, e in self.entries.items() if e[key] == value}
+            paths = matches if paths is None else paths & matches
+        if paths is None:
+            paths = self.entries.keys()
+        entries = [self.entries[p] for p in paths]
+        return sorted(entries, key=lambda e: e['start_time'] or 0)
+
+    def latest(self, **filters):
+        sessions = self.query(**filters)
+        return sessions[-1] if sessions else None
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,204 @@
+'''Export the HDF5 archive to a columnar, long format dataset.
+
+Every session becomes one Parquet (or Arrow IPC) file with a row per
+sample: `session`, `t`, `weight`, `time_ms`, plus the session metadata as
+constant columns. The files share one schema, so the whole directory
+reads back as a single table for vectorized cross-session queries:
+
+    python columnar_export.py recorded_data.hdf5 export/
+    table = load_archive('export/', name='dilraj')
+    df = table.to_pandas()   # or polars.from_arrow(table)
+
+Sessions are exported in parallel worker processes, and a manifest in
+the output directory records what has been exported, so later runs only
+export new or changed sessions. Needs pyarrow.
+'''
+import os
+import json
+import argparse
+import concurrent.futures
+
+import numpy as np
+import h5py as hp
+
+from catalog import Catalog, _meta
+from analysis import session_times
+
+FORMATS = {'parquet': '.parquet', 'arrow': '.arrow'}
+MANIFEST = 'manifest.json'
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+        import pyarrow.feather
+        import pyarrow.dataset
+    except ImportError:
+        raise ImportError("Exporting to Parquet/Arrow needs pyarrow: pip install pyarrow")
+    return pyarrow
+
+
+def schema(pa):
+    return pa.schema([
+        ('session', pa.dictionary(pa.int32(), pa.string())),
+        ('t', pa.float64()),
+        ('weight', pa.float64()),
+        ('time_ms', pa.int64()),
+        ('name', pa.dictionary(pa.int32(), pa.string())),
+        ('arm_used', pa.dictionary(pa.int32(), pa.string())),
+        ('hold_size_mm', pa.float64()),
+        ('sample_rate', pa.float64()),
+        ('start_time', pa.float64()),
+        ('complete', pa.bool_()),
+    ])
+
+
+def export_name(path, fmt='parquet'):
+    return path.replace('/', '_').replace(':', '-') + FORMATS[fmt]
+
+
+def _constant(pa, value, n, field_type):
+    '''Column of `n` copies of `value`, dictionary encoded for strings.'''
+    if pa.types.is_dictionary(field_type):
+        if value is None:
+            return pa.DictionaryArray.from_arrays(pa.nulls(n, pa.int32()), pa.array([], pa.string()))
+        return pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, dtype=np.int32)), pa.array([value]))
+    return pa.array(np.full(n, value), field_type) if value is not None else pa.nulls(n, field_type)
+
+
+def session_table(path, grp, entry):
+    '''Long format table of one stored session.'''
+    pa = _pyarrow()
+    wdata = grp['wdata'][:]
+    n = len(wdata)
+    tdata = session_times(grp)
+    time_ms = grp['time_ms'][:] if 'time_ms' in grp else None
+    sample_rate = _meta(grp, 'sample_rate')
+    constants = {
+        'session': path,
+        'name': None if entry['name'] is None else str(entry['name']),
+        'arm_used': None if entry['arm_used'] is None else str(entry['arm_used']),
+        'hold_size_mm': entry['hold_size_mm'],
+        'sample_rate': None if sample_rate is None else float(sample_rate),
+        'start_time': entry['start_time'],
+        'complete': entry['complete'],
+    }
+    columns = []
+    for field in schema(pa):
+        if field.name == 't':
+            columns.append(pa.array(tdata, field.type))
+        elif field.name == 'weight':
+            columns.append(pa.array(wdata, field.type))
+        elif field.name == 'time_ms':
+            columns.append(pa.array(time_ms, field.type) if time_ms is not None else pa.nulls(n, field.type))
+        else:
+            columns.append(_constant(pa, constants[field.name], n, field.type))
+    return pa.Table.from_arrays(columns, schema=schema(pa))
+
+
+def _export_session(data_file, path, entry, dest, fmt):
+    '''Worker: write one session to `dest`. Runs in its own process, so
+    every worker opens the data file itself.'''
+    pa = _pyarrow()
+    with hp.File(data_file, 'r') as hfile:
+        table = session_table(path, hfile[path], entry)
+    tmp = dest + '.tmp'
+    if fmt == 'parquet':
+        pa.parquet.write_table(table, tmp)
+    else:
+        pa.feather.write_feather(table, tmp, compression='uncompressed')
+    # Only replace the old export once the new one is complete
+    os.replace(tmp, dest)
+    return path, table.num_rows
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {'format': None, 'sessions': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir, manifest):
+    with open(os.path.join(out_dir, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=1)
+
+
+def export_archive(data_file, out_dir, fmt='parquet', workers=None, force=False):
+    '''Export every session of `data_file` to `out_dir`. Sessions already
+    exported with the same number of samples are skipped unless `force`
+    is set. Returns the paths of the sessions that were (re)exported.'''
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format {fmt!r}, expected one of {list(FORMATS)}")
+    _pyarrow()
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    if manifest['format'] != fmt:
+        # Switching formats, nothing already there can be reused
+        manifest = {'format': fmt, 'sessions': {}}
+    exported = manifest['sessions']
+
+    catalog = Catalog(data_file)
+    todo = [
+        entry for entry in catalog.query()
+        if entry['n_samples'] > 0 and (
+            force or entry['path'] not in exported
+            or exported[entry['path']]['n_samples'] != entry['n_samples']
+            or exported[entry['path']]['complete'] != entry['complete'])
+    ]
+    done = []
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        futures = [
+            pool.submit(_export_session, data_file, entry['path'], entry,
+                        os.path.join(out_dir, export_name(entry['path'], fmt)), fmt)
+            for entry in todo
+        ]
+        for entry, future in zip(todo, futures):
+            path, n_rows = future.result()
+            exported[path] = {
+                'file': export_name(path, fmt),
+                'n_samples': n_rows,
+                'complete': entry['complete'],
+            }
+            done.append(path)
+            # Saved as we go, so an interrupted export can be resumed
+            save_manifest(out_dir, manifest)
+
+    # Drop exports of sessions that are gone from the archive
+    for path in set(exported) - set(catalog.entries):
+        stale = os.path.join(out_dir, exported.pop(path)['file'])
+        if os.path.exists(stale):
+            os.remove(stale)
+    save_manifest(out_dir, manifest)
+    return done
+
+
+def load_archive(out_dir, columns=None, **filters):
+    '''Read an exported archive back as one `pyarrow.Table`, optionally
+    only some `columns` and the rows matching every `column=value` filter.'''
+    pa = _pyarrow()
+    manifest = load_manifest(out_dir)
+    files = [os.path.join(out_dir, s['file']) for s in manifest['sessions'].values()]
+    if not files:
+        return schema(pa).empty_table()
+    fmt = 'parquet' if manifest['format'] == 'parquet' else 'ipc'
+    dataset = pa.dataset.dataset(sorted(files), schema=schema(pa), format=fmt)
+    expression = None
+    for key, value in filters.items():
+        condition = pa.dataset.field(key) == value
+        expression = condition if expression is None else expression & condition
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the HDF5 archive to Parquet/Arrow.')
+    parser.add_argument('data_file', nargs='?', default='recorded_data.hdf5')
+    parser.add_argument('out_dir', nargs='?', default='export')
+    parser.add_argument('--format', choices=list(FORMATS), default='parquet')
+    parser.add_argument('--workers', type=int, help='worker processes (default one per CPU)')
+    parser.add_argument('--force', action='store_true', help='re-export every session')
+    args = parser.parse_args()
+    done = export_archive(args.data_file, args.out_dir, args.format, args.workers, args.force)
+    print(f'Exported {len(done)} session(s) to {args.out_dir}')
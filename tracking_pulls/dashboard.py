@@ -0,0 +1,284 @@
+'''Web dashboard to watch a session live, e.g. from a tablet, and to
+browse archived sessions.
+
+    python dashboard.py                 # first Arduino found
+    python dashboard.py --simulate      # SimulatedScale, no hardware
+    python dashboard.py --archive-only
+
+then open http://<host>:8050. One acquisition thread feeds a shared
+`LiveFeed`, so every extra browser only costs the few points it is sent.
+The feed keeps min/max decimated copies of the trace at power of two
+bucket widths; each client is served the level matching its screen
+width and only receives buckets it has not seen yet, via the graph's
+`extendData`. Archived sessions are decimated on the server to the
+visible range whenever the client zooms. The data file is only opened
+while answering such a request, so a recorder can keep writing to it,
+and the session list is refreshed from the catalog as sessions are added.
+'''
+import math
+import time
+import argparse
+import threading
+
+import numpy as np
+import dash
+from dash import dcc, html, Input, Output, State
+
+from sample_buffer import SampleBuffer
+from decimate import MinMaxDecimator, interleave, minmax_decimate
+
+
+class LiveFeed:
+    '''Samples of the running session, shared by all clients.
+
+    Decimators are created on demand for each level a client asks for,
+    level `k` having buckets `base_width * 2**k` seconds wide, and are all
+    kept up to date as samples arrive. Only completed buckets are handed
+    out, so what a client has received never changes afterwards.'''
+    def __init__(self, base_width=0.001, window=30):
+        self.base_width = base_width
+        self.window = window
+        self.samples = SampleBuffer()
+        self.decimators = {}
+        self.status = ''
+        # Bumped on `reset`, so clients know to start over
+        self.epoch = 0
+        self._lock = threading.Lock()
+        # Serialized replies, shared by clients asking for the same points
+        self._cache = {}
+
+    def reset(self):
+        with self._lock:
+            self.samples.clear()
+            self.decimators.clear()
+            self._cache.clear()
+            self.epoch += 1
+
+    def extend(self, t, w):
+        with self._lock:
+            self.samples.extend(t, w)
+            for decimator in self.decimators.values():
+                decimator.extend(t, w)
+
+    def level(self, pixels):
+        '''Level whose buckets are at most one pixel of the live window.'''
+        width = self.window / max(pixels, 1)
+        return max(0, math.floor(math.log2(width / self.base_width)))
+
+    def _decimator(self, level):
+        decimator = self.decimators.get(level)
+        if decimator is None:
+            decimator = MinMaxDecimator(self.base_width * 2**level)
+            decimator.extend(self.samples.t, self.samples.w)
+            self.decimators[level] = decimator
+        return decimator
+
+    def max_points(self, level):
+        '''Points covering the live window at `level`.'''
+        return 2 * math.ceil(self.window / (self.base_width * 2**level)) + 2
+
+    def since(self, level, sent=None):
+        '''Completed buckets at `level` after the first `sent` ones, as
+        lists ready to serialize, and the new count. With `sent` None,
+        the buckets of the last `window` seconds.'''
+        with self._lock:
+            decimator = self._decimator(level)
+            done = max(len(decimator.lo) - 1, 0)
+            if sent is None:
+                sent = int(np.searchsorted(decimator.hi.t[:done], decimator.hi.t[done - 1] - self.window)) if done else 0
+            key = (level, sent, done)
+            if key not in self._cache:
+                lo, hi = decimator.lo, decimator.hi
+                t, w = interleave(lo.t[sent:done], lo.w[sent:done], hi.t[sent:done], hi.w[sent:done])
+                if len(self._cache) > 256:
+                    self._cache.clear()
+                self._cache[key] = (t.tolist(), w.tolist())
+            t, w = self._cache[key]
+        return t, w, done
+
+
+def acquire(scale, feed, interval=0.05, frames=None):
+    '''Move samples from `scale`'s reader (or from `frames`) into `feed`,
+    forever. Run on its own thread, this is the only place the serial data
+    is processed.'''
+    if frames is None:
+        frames = scale.reader_stream()
+    while True:
+        time.sleep(interval)
+        n = scale.samples.total
+        scale.update(next(frames))
+        n = scale.samples.total - n
+        if n:
+            feed.extend(scale.tdata[-n:], scale.wdata[-n:])
+            live = scale.analytics.summary()
+            feed.status = (f"peak {live['peak_force']:.1f} kg   RFD {scale.analytics.slope:.1f} kg/s"
+                           f"   max RFD {live['max_rfd']:.1f} kg/s   pulls {live['pulls']}")
+
+
+def figure(t, w, title, uirevision=None):
+    return {
+        'data': [{'x': t, 'y': w, 'type': 'scattergl', 'mode': 'lines'}],
+        'layout': {
+            'title': {'text': title},
+            'xaxis': {'title': {'text': 'time (s)'}},
+            'yaxis': {'title': {'text': 'Weight (kg)'}},
+            'uirevision': uirevision,
+            'margin': {'l': 50, 'r': 20, 't': 40, 'b': 40},
+        },
+    }
+
+
+def archive_window(session, pixels, t0=None, t1=None):
+    '''Decimated (t, w) of an archived session between t0 and t1, at about
+    one min/max pair per pixel. Only the visible samples are read.'''
+    t, w = session.window(t0, t1)
+    t = np.asarray(t, dtype=np.float64)
+    w = np.asarray(w, dtype=np.float64)
+    if len(t) > 2 * pixels:
+        t, w = minmax_decimate(t, w, (t[-1] - t[0]) / pixels, t[0])
+    return t.tolist(), w.tolist()
+
+
+def create_app(feed=None, data_file=None):
+    '''The Dash app, showing `feed` live and/or the sessions of `data_file`.'''
+    app = dash.Dash(__name__, title='Scale')
+    tabs = []
+    if feed is not None:
+        tabs.append(dcc.Tab(label='Live', value='live', children=[
+            html.Div(id='status', style={'fontFamily': 'monospace'}),
+            dcc.Graph(id='live', figure=figure([], [], 'Live'), style={'height': '80vh'}),
+            dcc.Interval(id='tick', interval=250),
+            dcc.Store(id='cursor'),
+        ]))
+    if data_file is not None:
+        from catalog import Catalog
+        from session_reader import SessionReader
+
+        def session_options():
+            return [
+                {'label': f"{e['path']}  {e['name'] or ''} {e['arm_used'] or ''}", 'value': e['path']}
+                for e in reversed(Catalog(data_file).query()) if e['n_samples']
+            ]
+        tabs.append(dcc.Tab(label='Archive', value='archive', children=[
+            dcc.Dropdown(id='session'),
+            dcc.Interval(id='catalog-tick', interval=10000),
+            dcc.Graph(id='archive', style={'height': '80vh'}),
+        ]))
+    app.layout = html.Div([
+        dcc.Tabs(id='tabs', value=tabs[0].value, children=tabs),
+        # Client screen width, so points are only sent at its resolution
+        dcc.Store(id='width'),
+        dcc.Interval(id='measure', interval=2000),
+    ])
+
+    app.clientside_callback(
+        '''function(n, old) {
+            var w = window.innerWidth;
+            return w === old ? window.dash_clientside.no_update : w;
+        }''',
+        Output('width', 'data'),
+        Input('measure', 'n_intervals'),
+        State('width', 'data'),
+    )
+
+    if feed is not None:
+        @app.callback(
+            Output('live', 'figure'),
+            Output('live', 'extendData'),
+            Output('cursor', 'data'),
+            Output('status', 'children'),
+            Input('tick', 'n_intervals'),
+            State('cursor', 'data'),
+            State('width', 'data'),
+        )
+        def update_live(_, cursor, width):
+            level = feed.level(width or 1000)
+            if cursor is None or cursor['level'] != level or cursor['epoch'] != feed.epoch:
+                # New client, resized screen or new session: send the window
+                t, w, sent = feed.since(level)
+                cursor = {'level': level, 'epoch': feed.epoch, 'sent': sent}
+                return figure(t, w, 'Live', uirevision='live'), dash.no_update, cursor, feed.status
+            t, w, sent = feed.since(level, cursor['sent'])
+            if not t:
+                return dash.no_update, dash.no_update, dash.no_update, feed.status
+            cursor = dict(cursor, sent=sent)
+            extend = [{'x': [t], 'y': [w]}, [0], feed.max_points(level)]
+            return dash.no_update, extend, cursor, feed.status
+
+    if data_file is not None:
+        @app.callback(
+            Output('session', 'options'),
+            Output('session', 'value'),
+            Input('tabs', 'value'),
+            Input('catalog-tick', 'n_intervals'),
+            State('session', 'value'),
+        )
+        def update_sessions(tab, _, path):
+            options = session_options()
+            if path is None and options:
+                path = options[0]['value']
+            return options, path
+
+        @app.callback(
+            Output('archive', 'figure'),
+            Input('session', 'value'),
+            Input('archive', 'relayoutData'),
+            Input('width', 'data'),
+        )
+        def update_archive(path, relayout, width):
+            if path is None:
+                return figure([], [], '')
+            t0 = t1 = None
+            if dash.ctx.triggered_id == 'archive' and relayout:
+                # Re-decimate the zoomed range, autorange resets to everything
+                t0 = relayout.get('xaxis.range[0]')
+                t1 = relayout.get('xaxis.range[1]')
+            try:
+                with SessionReader(data_file) as reader:
+                    t, w = archive_window(reader.session(path), width or 1000, t0, t1)
+            except OSError:
+                # Locked by a recorder that is just starting up or closing
+                return figure([], [], f'{path} (data file busy, zoom to retry)', uirevision=path)
+            return figure(t, w, path, uirevision=path)
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Live and archive web dashboard.')
+    parser.add_argument('--data-file', default='recorded_data.hdf5')
+    parser.add_argument('--port', help='serial port of the Arduino (default: first found)')
+    parser.add_argument('--simulate', action='store_true', help='use a SimulatedScale')
+    parser.add_argument('--subscribe', metavar='ADDRESS',
+                        help="watch a running recorder's --publish stream instead of a port")
+    parser.add_argument('--archive-only', action='store_true')
+    parser.add_argument('--window', type=float, default=30, help='live window in seconds')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--http-port', type=int, default=8050)
+    args = parser.parse_args()
+
+    feed = None
+    if not args.archive_only:
+        import serial
+        from scale_core import Scale
+
+        scale = Scale(None, 0)
+        frames = None
+        if args.subscribe:
+            from pubsub import Subscriber
+            subscriber = Subscriber(args.subscribe)
+            frames = iter(subscriber.drain, None)
+        elif args.simulate:
+            from simulator import SimulatedScale
+            scale.set_arduino(SimulatedScale(timeout=0.1))
+        else:
+            scale.port = args.port
+            scale.set_arduino(serial.Serial(scale.find_arduino(), baudrate=115200, timeout=0.1))
+        if frames is None:
+            print(f'Scale ready after {scale.connect():.2f} s')
+            scale.start_reader(delay=100)
+        feed = LiveFeed(window=args.window)
+        threading.Thread(target=acquire, args=(scale, feed, 0.05, frames), daemon=True).start()
+
+    app = create_app(feed, args.data_file)
+    app.run(host=args.host, port=args.http_port)
@@ -0,0 +1,95 @@
+import numpy as np
+
+from sample_buffer import SampleBuffer
+
+
+def _bucket_extremes(t, w, ids):
+    '''Per run of equal bucket ids, the bucket id and the time and value
+    of the minimum and of the maximum.'''
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    counts = np.diff(np.r_[starts, len(w)])
+    minv = np.minimum.reduceat(w, starts)
+    maxv = np.maximum.reduceat(w, starts)
+    # Index of the first occurrence of each extreme within its bucket
+    pos = np.arange(len(w))
+    imin = np.minimum.reduceat(np.where(w == np.repeat(minv, counts), pos, len(w)), starts)
+    imax = np.minimum.reduceat(np.where(w == np.repeat(maxv, counts), pos, len(w)), starts)
+    return ids[starts], t[imin], minv, t[imax], maxv
+
+
+def interleave(tmin, wmin, tmax, wmax):
+    '''Merge per bucket minima and maxima into one time ordered trace.'''
+    min_first = tmin <= tmax
+    t = np.empty(2*len(tmin))
+    w = np.empty(2*len(tmin))
+    t[0::2] = np.where(min_first, tmin, tmax)
+    t[1::2] = np.where(min_first, tmax, tmin)
+    w[0::2] = np.where(min_first, wmin, wmax)
+    w[1::2] = np.where(min_first, wmax, wmin)
+    return t, w
+
+
+def minmax_decimate(t, w, width, t0=0):
+    '''Reduce (t, w) to the minimum and maximum of every `width` wide
+    time bucket. Peaks are kept exactly.'''
+    if len(t) == 0:
+        return t, w
+    ids = ((t - t0) // width).astype(np.int64)
+    _, tmin, wmin, tmax, wmax = _bucket_extremes(t, w, ids)
+    return interleave(tmin, wmin, tmax, wmax)
+
+
+class MinMaxDecimator:
+    '''Incrementally maintained min/max decimation of a growing trace.
+
+    Samples are grouped into time buckets `width` wide, typically one
+    pixel of the plot, and only each bucket's minimum and maximum are
+    kept. Adding a batch costs O(batch) and the output is bounded by the
+    number of buckets, not by the number of samples.'''
+    def __init__(self, width, t0=0):
+        self.width = width
+        self.t0 = t0
+        self.lo = SampleBuffer()
+        self.hi = SampleBuffer()
+        self.last_id = None
+
+    def __len__(self):
+        return 2*len(self.lo)
+
+    def extend(self, t, w):
+        '''Add samples, which must come after everything already added.'''
+        t = np.asarray(t, dtype=np.float64)
+        w = np.asarray(w, dtype=np.float64)
+        if len(t) == 0:
+            return
+        ids = ((t - self.t0) // self.width).astype(np.int64)
+        ids, tmin, wmin, tmax, wmax = _bucket_extremes(t, w, ids)
+
+        if ids[0] == self.last_id:
+            # The batch continues the last bucket, fold it in
+            if wmin[0] < self.lo.w[-1]:
+                self.lo.t[-1] = tmin[0]
+                self.lo.w[-1] = wmin[0]
+            if wmax[0] > self.hi.w[-1]:
+                self.hi.t[-1] = tmax[0]
+                self.hi.w[-1] = wmax[0]
+            ids, tmin, wmin, tmax, wmax = ids[1:], tmin[1:], wmin[1:], tmax[1:], wmax[1:]
+
+        self.lo.extend(tmin, wmin)
+        self.hi.extend(tmax, wmax)
+        if len(ids):
+            self.last_id = ids[-1]
+
+    def set_width(self, width):
+        '''Change the bucket width, rebuilding from the kept extremes. This
+        is exact when the new width is a multiple of the old one.'''
+        t, w = self.points()
+        self.width = width
+        self.lo.clear()
+        self.hi.clear()
+        self.last_id = None
+        self.extend(t, w)
+
+    def points(self):
+        '''The decimated trace as (t, w) arrays.'''
+        return interleave(self.lo.t, self.lo.w, self.hi.t, self.hi.w)
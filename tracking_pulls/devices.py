@@ -0,0 +1,186 @@
+import sys
+import time
+import datetime
+import concurrent.futures
+
+import numpy as np
+import serial
+
+from scale_core import Scale, find_arduinos
+from session_writer import SessionWriter
+
+
+class Channel:
+    '''One load cell of a multi-scale rig.'''
+    def __init__(self, label, port, dt=0.1):
+        self.label = label
+        self.port = port
+        self.scale = Scale(None, 0, dt=dt)
+        self.scale.port = port
+
+    @property
+    def samples(self):
+        '''Samples received so far, with `t` in seconds of device time.'''
+        return self.scale.samples
+
+    @property
+    def writer(self):
+        return self.scale.writer
+
+    @property
+    def clock_offset(self):
+        return self.scale.reader.clock_offset
+
+
+class DeviceManager:
+    '''Acquire from several Arduinos at once.
+
+    Every matching port gets its own `Scale` connection and background
+    reader. Bring-up (open, tare, handshake) runs in parallel, so it takes
+    as long as the slowest board rather than the sum of all of them. Each
+    board's `millis()` clock is mapped onto the host clock using the
+    smallest observed arrival delay, which puts all channels on one
+    shared timebase.
+
+    `record` streams every channel into its own session group through a
+    `SessionWriter`, named `<group_name>-<label>`. The groups keep the
+    device times; their `clock_offset` and `host_t0` attributes map
+    `time_ms` onto the shared timebase, see `channel_times`.'''
+    def __init__(self, ports=None, labels=None, dt=0.1):
+        if ports is None:
+            ports = find_arduinos()
+        if not ports:
+            raise IOError("No Arduino found on any serial port.")
+        if labels is None:
+            labels = [f'scale{i}' for i in range(len(ports))]
+        self.channels = [Channel(label, port, dt) for label, port in zip(labels, ports)]
+        self.t0 = None
+
+    def _connect(self, channel):
+        arduino = serial.Serial(channel.port, baudrate=115200, timeout=0.1)
+        channel.scale.set_arduino(arduino)
+        # Handshake, and tare unless the board reset and tared itself
+        channel.scale.connect()
+
+    def connect(self):
+        with concurrent.futures.ThreadPoolExecutor(len(self.channels)) as pool:
+            # list() so exceptions from any board are raised here
+            list(pool.map(self._connect, self.channels))
+
+    def record(self, data_file, group_name, attrs=None, catalog=None):
+        '''Write every channel's samples to `data_file` as they arrive.'''
+        labels = [channel.label for channel in self.channels]
+        for channel in self.channels:
+            channel.scale.writer = SessionWriter(data_file, f'{group_name}-{channel.label}', attrs={
+                **(attrs or {}),
+                'channel': channel.label,
+                'channels': labels,
+                'port': channel.port,
+                'sample_rate': 1 / channel.scale.dt,
+            }, catalog=catalog)
+
+    def start(self, delay=100):
+        self.t0 = time.perf_counter()
+        for channel in self.channels:
+            if channel.writer is not None:
+                channel.writer.grp.attrs['host_t0'] = self.t0
+            channel.scale.start_reader(delay)
+
+    def poll(self):
+        '''Collect what every channel received since the last call. Returns
+        {label: (t, w)} with t in seconds on the shared timebase, as far as
+        the clock offsets are known yet.'''
+        batches = {}
+        for channel in self.channels:
+            time_ms, weight = channel.scale.reader.drain()
+            offset = channel.clock_offset
+            channel.scale.update((time_ms, weight))
+            if channel.writer is not None and offset != channel.writer.grp.attrs.get('clock_offset'):
+                # Kept current, so even an interrupted recording can be aligned
+                channel.writer.grp.attrs['clock_offset'] = offset
+            batches[channel.label] = (time_ms / 1000 + offset - self.t0, weight)
+        return batches
+
+    def aligned(self, channel):
+        '''All of a channel's samples, re-aligned with the latest (most
+        accurate) clock offset.'''
+        return channel.samples.ms / 1000 + channel.clock_offset - self.t0, channel.samples.w
+
+    def synchronized(self, dt=None):
+        '''Resample every channel onto one time grid covering the span all
+        channels have data for. Returns t and an (n_channels, n) array.'''
+        traces = [self.aligned(channel) for channel in self.channels]
+        if any(len(t) == 0 for t, _ in traces):
+            return np.empty(0), np.empty((len(traces), 0))
+        if dt is None:
+            dt = min(np.median(np.diff(t)) if len(t) > 1 else np.inf for t, _ in traces)
+        start = max(t[0] for t, _ in traces)
+        stop = min(t[-1] for t, _ in traces)
+        grid = np.arange(start, stop, dt) if np.isfinite(dt) else np.array([start])
+        return grid, np.array([np.interp(grid, t, w) for t, w in traces])
+
+    def stop(self, complete=True):
+        '''Stop acquiring and close the channels' session groups.'''
+        started = self.t0 is not None and all(c.scale.reader is not None for c in self.channels)
+        for channel in self.channels:
+            channel.scale.stop_reader()
+            if channel.scale.arduino is not None:
+                channel.scale.arduino.close()
+        if started:
+            # Whatever arrived since the last poll
+            self.poll()
+        for channel in self.channels:
+            if channel.writer is not None:
+                attrs = channel.scale.timing_stats()
+                if channel.scale.reader is not None:
+                    attrs.update(channel.scale.reader.stats())
+                    attrs['clock_offset'] = channel.clock_offset
+                channel.writer.close(complete=complete, attrs=attrs)
+
+
+def channel_times(grp):
+    '''Times of a channel group written by `DeviceManager.record` on the
+    rig's shared timebase, in seconds since acquisition started.'''
+    return grp['time_ms'][:] / 1000 + grp.attrs['clock_offset'] - grp.attrs['host_t0']
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+    from live_plot import LivePlot
+    from catalog import Catalog
+
+    # Optional channel labels, e.g. `python devices.py left right feet`
+    manager = DeviceManager(labels=sys.argv[1:] or None)
+    name = input('Name:')
+    print(f'Connecting to {[c.port for c in manager.channels]}')
+    start = time.perf_counter()
+    manager.connect()
+    print(f'All scales ready after {time.perf_counter() - start:.2f} s')
+
+    fig, axes = plt.subplots(len(manager.channels), 1, squeeze=False)
+    plots = {c.label: LivePlot(ax, 10) for c, ax in zip(manager.channels, axes[:, 0])}
+    for label, plot in plots.items():
+        plot.ax.set_title(label)
+
+    def refresh():
+        batches = manager.poll()
+        for channel in manager.channels:
+            n_new = len(batches[channel.label][0])
+            if n_new:
+                plots[channel.label].update(channel.samples.t, channel.samples.w, n_new=n_new)
+
+    current_date = datetime.datetime.fromtimestamp(time.time())
+    group_name = (f'{current_date.day}-{current_date.month}-{current_date.year}/'
+                  f'{current_date.hour}:{current_date.minute}:{current_date.second}')
+    data_file = './recorded_data.hdf5'
+    manager.record(data_file, group_name, attrs={'name': name}, catalog=Catalog(data_file))
+    complete = False
+    try:
+        manager.start()
+        timer = fig.canvas.new_timer(interval=100)
+        timer.add_callback(refresh)
+        timer.start()
+        plt.show()
+        complete = True
+    finally:
+        manager.stop(complete)
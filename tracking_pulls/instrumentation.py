@@ -0,0 +1,154 @@
+import json
+import math
+import time
+import threading
+
+import numpy as np
+
+# Histogram buckets are quarter octaves of microseconds, 1 us to ~17 min
+BUCKETS_PER_OCTAVE = 4
+N_BUCKETS = 30 * BUCKETS_PER_OCTAVE
+
+
+class _Timer:
+    '''Context manager that adds its elapsed time to one stage.'''
+    __slots__ = ('stats', 'name', 'start')
+
+    def __init__(self, stats, name):
+        self.stats = stats
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stats.add(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class Stage:
+    '''Call count, total time and log-scale histogram of one stage.'''
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.hist = np.zeros(N_BUCKETS, dtype=np.int64)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        us = seconds * 1e6
+        bucket = int(math.log2(us) * BUCKETS_PER_OCTAVE) if us > 1 else 0
+        self.hist[min(bucket, N_BUCKETS - 1)] += 1
+
+    def percentile(self, q):
+        '''Upper edge of the bucket holding the q-th percentile, in seconds.'''
+        if self.count == 0:
+            return np.nan
+        bucket = np.searchsorted(np.cumsum(self.hist), q / 100 * self.count)
+        return min(2 ** ((bucket + 1) / BUCKETS_PER_OCTAVE) / 1e6, self.max)
+
+    def stats(self):
+        return {
+            'count': self.count,
+            'total_s': self.total,
+            'mean_ms': self.total / self.count * 1000 if self.count else np.nan,
+            'p50_ms': self.percentile(50) * 1000,
+            'p95_ms': self.percentile(95) * 1000,
+            'max_ms': self.max * 1000,
+        }
+
+
+class Instruments:
+    '''Counters and timing histograms for the acquisition hot path.
+
+    Stages are timed with `with instruments.time('read'):` or recorded with
+    `add`, and plain events are counted with `count`. Recording costs a
+    couple of microseconds; when `enabled` is False `time` returns a shared
+    no-op timer and nothing is recorded. One instance can be shared by the
+    reader thread and the GUI thread.'''
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.stages = {}
+        self.counters = {}
+        self.t_start = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def time(self, name):
+        if not self.enabled:
+            return NULL_TIMER
+        return _Timer(self, name)
+
+    def add(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                stage = self.stages[name] = Stage()
+            stage.add(seconds)
+
+    def count(self, name, n=1):
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name, value):
+        '''Set a counter that is kept elsewhere, e.g. a parser's.'''
+        with self._lock:
+            self.counters[name] = value
+
+    def _snapshot(self):
+        '''Stage statistics and counters, taken together.'''
+        with self._lock:
+            return {name: stage.stats() for name, stage in self.stages.items()}, dict(self.counters)
+
+    def stats(self):
+        '''Per stage statistics and the counters, as a JSON friendly dict.'''
+        stages, counters = self._snapshot()
+        return {
+            'elapsed_s': time.perf_counter() - self.t_start,
+            'stages': stages,
+            'counters': counters,
+        }
+
+    def report(self):
+        '''Short text summary, one line per stage, for the live overlay.'''
+        stages, counters = self._snapshot()
+        lines = []
+        for name, s in stages.items():
+            lines.append(f"{name:<7}{s['count']:>7}x  p50 {s['p50_ms']:6.2f}  "
+                         f"p95 {s['p95_ms']:6.2f}  max {s['max_ms']:7.2f} ms")
+        if counters:
+            lines.append('  '.join(f'{k} {v}' for k, v in counters.items()))
+        return '\n'.join(lines)
+
+    def attrs(self, prefix='perf_'):
+        '''Flat dict of the statistics, suitable for HDF5 attributes.'''
+        stages, counters = self._snapshot()
+        out = {}
+        for name, stats in stages.items():
+            for key, value in stats.items():
+                out[f'{prefix}{name}_{key}'] = value
+        for key, value in counters.items():
+            out[f'{prefix}{key}'] = value
+        return out
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.stats(), f, indent=1, default=float)
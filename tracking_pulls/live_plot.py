@@ -0,0 +1,120 @@
+import math
+
+import numpy as np
+import matplotlib as mplt
+
+from decimate import MinMaxDecimator, minmax_decimate
+
+
+class LivePlot:
+    '''Line plot of a growing trace, redrawn by blitting.
+
+    The line is drawn on top of a cached background bitmap of the axes, so
+    a normal frame only re-renders the line itself. The axis limits grow
+    in precomputed steps (the time axis doubles, the weight axis rounds up
+    to the next `ystep` with some headroom) so full redraws only happen a
+    handful of times per session. With `window` set the plot scrolls
+    instead, like `Scope` in `test/test_moving_plot.py`, and only the
+    samples inside the window are handed to the line.
+
+    With `decimate` on, the line only gets the minimum and maximum of each
+    pixel wide time bucket, so drawing cost is bounded by the axes width
+    while peaks stay exact.'''
+    def __init__(self, ax, tlim, ylims=(-1, 3), ystep=5, headroom=0.2, window=None, decimate=True):
+        self.ax = ax
+        self.tlim = tlim
+        self.ystep = ystep
+        self.headroom = headroom
+        self.window = window
+        self.xlow = 0
+        self.xhigh = window if window is not None else tlim
+        self.ylow, self.yhigh = ylims
+        self.background = None
+        # Number of full redraws, the rest of the frames are blitted
+        self.redraws = 0
+        self.decimator = MinMaxDecimator(self.bucket_width()) if decimate else None
+
+        self.line = mplt.lines.Line2D([], [], animated=True)
+        self.ax.add_line(self.line)
+        self.text = self.ax.text(0.02, 0.95, '', transform=self.ax.transAxes, va='top', animated=True)
+        self.ax.set_xlim(self.xlow, self.xhigh)
+        self.ax.set_ylim(self.ylow, self.yhigh)
+        self.ax.set_xlabel('time (s)')
+        self.ax.set_ylabel('Weight (kg)')
+
+        self.canvas = self.ax.figure.canvas
+        self.canvas.mpl_connect('draw_event', self._cache_background)
+
+    def _cache_background(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.text)
+
+    def bucket_width(self):
+        '''Time spanned by one pixel of the axes.'''
+        pixels = max(self.ax.bbox.width, 1)
+        return (self.xhigh - self.xlow) / pixels
+
+    def set_text(self, text):
+        '''Status line drawn in the corner of the axes on the next frame.'''
+        self.text.set_text(text)
+
+    def set_lims(self, xlims, ylims):
+        self.xlow, self.xhigh = xlims
+        self.ylow, self.yhigh = ylims
+        self.ax.set_xlim(self.xlow, self.xhigh)
+        self.ax.set_ylim(self.ylow, self.yhigh)
+
+    def _rescale(self, tlast, wmax):
+        '''Move the limits to the next step if the data left the axes.
+        Returns whether a full redraw is needed.'''
+        changed = False
+        if tlast >= self.xhigh:
+            if self.window is not None:
+                self.xlow = tlast
+                self.xhigh = tlast + self.window
+            else:
+                while self.xhigh <= tlast:
+                    self.xhigh *= 2
+                if self.decimator is not None:
+                    self.decimator.set_width(self.bucket_width())
+            self.ax.set_xlim(self.xlow, self.xhigh)
+            changed = True
+        if wmax > self.yhigh:
+            self.yhigh = self.ystep * math.ceil(wmax / self.ystep + self.headroom)
+            self.ax.set_ylim(self.ylow, self.yhigh)
+            changed = True
+        return changed
+
+    def update(self, tdata, wdata, wmax=None, n_new=None):
+        '''Show the trace (tdata, wdata), which must be sorted in time.
+        `wmax` is the largest weight in the trace, if already known, and
+        `n_new` the number of samples added since the last call.'''
+        if len(tdata) == 0:
+            return self.line, self.text
+        if wmax is None:
+            wmax = wdata.max()
+        if n_new is None:
+            n_new = len(tdata)
+        changed = self._rescale(tdata[-1], wmax)
+
+        if self.window is not None:
+            start = np.searchsorted(tdata, self.xlow)
+            tdata, wdata = tdata[start:], wdata[start:]
+            if self.decimator is not None:
+                tdata, wdata = minmax_decimate(tdata, wdata, self.bucket_width(), self.xlow)
+        elif self.decimator is not None:
+            self.decimator.extend(tdata[-n_new:], wdata[-n_new:])
+            tdata, wdata = self.decimator.points()
+        self.line.set_data(tdata, wdata)
+
+        if changed or self.background is None:
+            # Full redraw, `_cache_background` stores the new background
+            self.canvas.draw()
+            self.redraws += 1
+        else:
+            self.canvas.restore_region(self.background)
+            self.ax.draw_artist(self.line)
+            self.ax.draw_artist(self.text)
+            self.canvas.blit(self.ax.bbox)
+        return self.line, self.text
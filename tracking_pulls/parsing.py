@@ -0,0 +1,173 @@
+import warnings
+
+import numpy as np
+
+COMMA = ord(',')
+NEWLINE = ord('\n')
+RETURN = ord('\r')
+
+
+def _byte_class(chars):
+    '''Lookup table telling which byte values are in `chars`.'''
+    table = np.zeros(256, dtype=bool)
+    table[np.frombuffer(chars, dtype=np.uint8)] = True
+    return table
+
+
+# Whitespace that np.fromstring would also split on
+BLANK = _byte_class(b' \t\x0b\x0c')
+INTEGER = _byte_class(b'0123456789+-')
+
+
+class ChunkParser:
+    '''Parse `millis,weight` lines from raw serial chunks in bulk.
+
+    Chunks can be of any size, e.g. from `read_all()` or `read(n)`. A
+    trailing partial line is held back and completed by the next chunk.
+    Lines that do not parse are skipped and counted in `malformed`.'''
+    def __init__(self):
+        self.remainder = b''
+        self.parsed = 0
+        self.malformed = 0
+
+    def feed(self, chunk):
+        '''Return (time in ms, weight) arrays for every complete line.'''
+        data = self.remainder + chunk
+        end = data.rfind(b'\n')
+        if end < 0:
+            self.remainder = data
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        self.remainder = data[end + 1:]
+        data = data[:end + 1]
+
+        time_ms, weight = self._parse_fast(data)
+        if time_ms is None:
+            time_ms, weight = self._parse_lines(data)
+        self.parsed += len(time_ms)
+        return time_ms, weight
+
+    def reset(self):
+        self.remainder = b''
+
+    def _parse_fast(self, data):
+        '''Convert a block of well formed lines in one call. Returns
+        (None, None) if any line is not exactly `integer,number`, leaving
+        anything unusual to `_parse_lines`.'''
+        raw = np.frombuffer(data, dtype=np.uint8)
+        is_sep = (raw == COMMA) | (raw == NEWLINE)
+        seps = raw[is_sep]
+        n_lines = len(seps) // 2
+        # Separators must alternate comma, newline, comma, newline, ...
+        if len(seps) % 2 or not (np.all(seps[0::2] == COMMA) and np.all(seps[1::2] == NEWLINE)):
+            return None, None
+        # No whitespace but the line endings, so a number can't be split
+        # in two or move into the neighbouring field
+        if BLANK[raw].any():
+            return None, None
+        returns = np.flatnonzero(raw == RETURN)
+        if len(returns) and not np.all(raw[np.minimum(returns + 1, len(raw) - 1)] == NEWLINE):
+            return None, None
+        # Timestamps must be plain integers, `int()` rejects 1e3 or 1.0
+        in_time = ((np.cumsum(is_sep, dtype=np.uint8) & 1) == 0) & ~is_sep
+        if not INTEGER[raw[in_time]].all():
+            return None, None
+        text = data.replace(b',', b' ').decode('ascii', errors='replace')
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            try:
+                values = np.fromstring(text, sep=' ')
+            except (ValueError, DeprecationWarning):
+                return None, None
+        if len(values) != 2*n_lines:
+            return None, None
+        values = values.reshape(n_lines, 2)
+        return values[:, 0].astype(np.int64), values[:, 1]
+
+    def _parse_lines(self, data):
+        '''Slow path for blocks containing malformed lines.'''
+        time_ms = []
+        weight = []
+        for line in data.split(b'\n')[:-1]:
+            try:
+                t, W = line.decode().strip().split(',')
+                t, W = int(t), float(W)
+            except (ValueError, UnicodeDecodeError):
+                self.malformed += 1
+                continue
+            time_ms.append(t)
+            weight.append(W)
+        return np.array(time_ms, dtype=np.int64), np.array(weight, dtype=np.float64)
+
+
+# Layout of the packets sent by `scale_readout.ino` in STREAM_BINARY mode
+SYNC = b'\xa5\x5a'
+PACKET = np.dtype([
+    ('sync', 'u1', 2),
+    ('seq', '<u2'),
+    ('time_ms', '<u4'),
+    ('weight', '<f4'),
+    ('checksum', 'u1'),
+])
+
+
+class BinaryParser:
+    '''Decode fixed size binary weight packets from raw serial chunks.
+
+    Whole runs of aligned packets are decoded with one `np.frombuffer`
+    call. After a corrupt packet the parser skips ahead to the next sync
+    marker. Each corrupt stretch, up to the next good packet, counts once
+    in `malformed`, however many markers it takes to resynchronise; the
+    packets it cost show up as gaps in the sequence number, in `lost`.'''
+    def __init__(self):
+        self.remainder = b''
+        self.parsed = 0
+        self.malformed = 0
+        self.lost = 0
+        self.last_seq = None
+        self.resyncing = False
+
+    def feed(self, chunk):
+        '''Return (time in ms, weight) arrays for every complete packet.'''
+        data = self.remainder + chunk
+        size = PACKET.itemsize
+        packets = []
+        pos = 0
+        while len(data) - pos >= size:
+            n = (len(data) - pos) // size
+            raw = np.frombuffer(data, dtype=np.uint8, count=n*size, offset=pos).reshape(n, size)
+            ok = (raw[:, 0] == SYNC[0]) & (raw[:, 1] == SYNC[1])
+            ok &= raw[:, 2:-1].sum(axis=1, dtype=np.uint8) == raw[:, -1]
+            bad = np.flatnonzero(~ok)
+            n_good = bad[0] if len(bad) else n
+            if n_good:
+                packets.append(np.frombuffer(data, dtype=PACKET, count=n_good, offset=pos))
+                pos += n_good*size
+                self.resyncing = False
+            if n_good < n:
+                # Resynchronise on the next marker after the bad packet
+                if not self.resyncing:
+                    self.malformed += 1
+                    self.resyncing = True
+                nxt = data.find(SYNC, pos + 1)
+                pos = nxt if nxt >= 0 else len(data) - 1
+        self.remainder = data[pos:]
+
+        if not packets:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        packets = np.concatenate(packets)
+        self._count_lost(packets['seq'])
+        self.parsed += len(packets)
+        return packets['time_ms'].astype(np.int64), packets['weight'].astype(np.float64)
+
+    def _count_lost(self, seq):
+        seq = seq.astype(np.int64)
+        if self.last_seq is not None:
+            seq = np.concatenate(([self.last_seq], seq))
+        gaps = (np.diff(seq) - 1) % 65536
+        self.lost += int(gaps.sum())
+        self.last_seq = int(seq[-1])
+
+    def reset(self):
+        self.remainder = b''
+        self.last_seq = None
+        self.resyncing = False
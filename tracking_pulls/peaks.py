@@ -0,0 +1,84 @@
+import sys
+
+import numpy as np
+import h5py as hp
+from scipy.signal import find_peaks
+
+from analysis import session_times
+
+# Bump when the peak finding below changes, so cached indexes get rebuilt
+PEAKS_VERSION = 1
+
+# One row of a session's peak index, sorted by time
+PEAK = np.dtype([
+    ('index', np.int64),
+    ('t', np.float64),
+    ('weight', np.float64),
+    ('prominence', np.float64),
+    # Set while browsing, -1 until labelled
+    ('hold', np.int16),
+    ('valid', np.int8),
+])
+
+
+def find_session_peaks(tdata, wdata, height=2.0, prominence=2.0, min_spacing=0.5):
+    '''Peaks of a whole trace in one vectorized pass: local maxima above
+    `height` kg that stand out by `prominence` kg, at least `min_spacing`
+    seconds apart. Returns a `PEAK` array sorted by time.'''
+    tdata = np.asarray(tdata, dtype=np.float64)
+    wdata = np.asarray(wdata, dtype=np.float64)
+    if len(wdata) < 3:
+        return np.zeros(0, dtype=PEAK)
+    dt = np.median(np.diff(tdata))
+    distance = max(int(min_spacing / dt), 1) if dt > 0 else 1
+    index, props = find_peaks(wdata, height=height, prominence=prominence, distance=distance)
+    peaks = np.zeros(len(index), dtype=PEAK)
+    peaks['index'] = index
+    peaks['t'] = tdata[index]
+    peaks['weight'] = wdata[index]
+    peaks['prominence'] = props['prominences']
+    peaks['hold'] = -1
+    peaks['valid'] = -1
+    return peaks
+
+
+def write_peaks(grp, peaks=None):
+    '''Index a stored session's peaks and save them as its `peaks` dataset.'''
+    if peaks is None:
+        peaks = find_session_peaks(session_times(grp), grp['wdata'][:])
+    if 'peaks' in grp:
+        del grp['peaks']
+    grp['peaks'] = peaks
+    grp.attrs['peaks_version'] = PEAKS_VERSION
+    return peaks
+
+
+def load_peaks(grp):
+    '''Peak index of a session group, built and cached in the group on
+    first use (if the file is writable).'''
+    if 'peaks' in grp and grp.attrs.get('peaks_version') == PEAKS_VERSION:
+        return grp['peaks'][:]
+    if 'wdata' not in grp:
+        return np.zeros(0, dtype=PEAK)
+    peaks = find_session_peaks(session_times(grp), grp['wdata'][:])
+    if grp.file.mode == 'r+':
+        write_peaks(grp, peaks)
+    return peaks
+
+
+def peak_near(peaks, t, step=0):
+    '''Position in `peaks` of the peak `step` places after the one at or
+    after time `t`, clipped to the index. O(log n).'''
+    i = int(np.searchsorted(peaks['t'], t)) + step
+    return min(max(i, 0), len(peaks) - 1)
+
+
+if __name__ == '__main__':
+    # Build the peak index of every session, e.g. `python peaks.py recorded_data.hdf5`
+    data_file = sys.argv[1] if len(sys.argv) > 1 else 'recorded_data.hdf5'
+    with hp.File(data_file, 'r+') as hfile:
+        for day in hfile:
+            for name in hfile[day]:
+                if 'wdata' in hfile[day][name]:
+                    peaks = load_peaks(hfile[day][name])
+                    print(f'{day}/{name}: {len(peaks)} peaks')
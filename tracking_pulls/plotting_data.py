@@ -1,29 +1,34 @@
 import matplotlib.pyplot as plt
-import matplotlib as mplt
-import numpy as np
-import h5py as hp
-import copy
+import sys
 
-def derivative(xvalue, yvalue):
-    ydiff = np.array(yvalue[1:]) - np.array(yvalue[:-1])
-    xdiff = np.array(xvalue[1:]) - np.array(xvalue[:-1])
-    return ydiff/xdiff
+from catalog import Catalog
+from analysis import smoothed_derivatives
+from session_reader import SessionReader
+from segmentation import segment_pulls
 
 if __name__ == '__main__':
     fig, ax = plt.subplots(2,1)
-    with hp.File('./recorded_data.hdf5', 'r') as hfile:
-        grp = hfile['18-2-2025']['17:0001-01-01 00:00:00:59']
-        data = copy.deepcopy(np.array(grp['wdata']))
-    dt = 0.1
-    time = np.arange(0, len(data)*dt, dt)
-    slope = derivative(time, data)
-    second_derivative = derivative(time[:-1], slope)
-    max_force_gen = max(slope)
-    min_force_gen = min(slope)
-    max_index = np.argmax(slope)
-    min_index = np.argmin(slope)
+    data_file = './recorded_data.hdf5'
+    # Plot the session given on the command line, or the latest one
+    if len(sys.argv) > 1:
+        session = sys.argv[1]
+    else:
+        session = Catalog(data_file).latest(complete=True)['path']
+    # Opened writable so summaries of older sessions get cached
+    with SessionReader(data_file, 'r+') as reader:
+        session = reader.session(session)
+        summary = session.summary()
+        time, data = session.window()
+        reps = session.grp['reps'][:] if 'reps' in session.grp else segment_pulls(time, data)
+    slope, second_derivative = smoothed_derivatives(time, data)
+    max_force_gen = summary['max_rfd']
+    min_force_gen = summary['min_rfd']
+    max_index = int(summary['max_rfd_index'])
+    min_index = int(summary['min_rfd_index'])
     ax[0].plot(time, data)
     ax[0].fill_between(time[max_index:min_index], data[max_index:min_index], alpha=0.5)
-    ax[1].plot(time[:-1], slope, label='1st Derivative')
-    ax[1].plot(time[1:-1], second_derivative, label='2nd Derivative')
+    for rep in reps:
+        ax[0].axvspan(rep['t_start'], rep['t_end'], color='grey', alpha=0.2)
+    ax[1].plot(time, slope, label='1st Derivative')
+    ax[1].plot(time, second_derivative, label='2nd Derivative')
     plt.show()
@@ -0,0 +1,292 @@
+'''Fan the live sample stream out to several local consumers.
+
+Only one program can read the serial port. With a `Publisher` attached
+(`scale.publisher = Publisher('/tmp/scale.sock')`), every batch that
+`Scale.update` decodes is also sent to any number of `Subscriber`s,
+e.g. the recorder, the dashboard and an analytics script. Addresses are
+a Unix socket path or `host:port` for TCP. Try it on localhost with
+
+    python record.py --simulate --publish /tmp/scale.sock
+    python pubsub.py /tmp/scale.sock
+'''
+import os
+import sys
+import time
+import socket
+import struct
+import threading
+import collections
+
+import numpy as np
+
+# Frame: magic, version, number of samples, then the device times (uint32
+# ms, like the firmware's millis()) and the weights (float64)
+HEADER = struct.Struct('<2sHI')
+MAGIC = b'SB'
+VERSION = 1
+POLICIES = ('drop_oldest', 'drop_newest', 'block', 'disconnect')
+
+
+def encode(time_ms, weight):
+    time_ms = np.asarray(time_ms).astype('<u4')
+    weight = np.asarray(weight).astype('<f8')
+    return HEADER.pack(MAGIC, VERSION, len(time_ms)) + time_ms.tobytes() + weight.tobytes()
+
+
+def decode(n, payload):
+    time_ms = np.frombuffer(payload, dtype='<u4', count=n).astype(np.int64)
+    weight = np.frombuffer(payload, dtype='<f8', count=n, offset=4*n)
+    return time_ms, weight
+
+
+def parse_address(address):
+    '''(family, address) for a Unix socket path or `host:port`.'''
+    if isinstance(address, tuple):
+        return socket.AF_INET, address
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit() and '/' not in address:
+        return socket.AF_INET, (host or 'localhost', int(port))
+    return socket.AF_UNIX, address
+
+
+def _recv_exact(sock, n):
+    data = bytearray()
+    while len(data) < n:
+        chunk = sock.recv(n - len(data))
+        if not chunk:
+            raise ConnectionError("Publisher closed the connection.")
+        data += chunk
+    return bytes(data)
+
+
+def _shutdown(sock):
+    '''Close `sock`, waking any thread blocked on it.'''
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    sock.close()
+
+
+class _Client(threading.Thread):
+    '''One subscriber connection with its own bounded queue of frames.'''
+    def __init__(self, sock, maxlen, policy, block_timeout):
+        super().__init__(daemon=True)
+        self.sock = sock
+        self.maxlen = maxlen
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.queue = collections.deque()
+        self.cond = threading.Condition()
+        self.closed = False
+        self.sent = 0
+        self.dropped = 0
+
+    def put(self, n, frame):
+        with self.cond:
+            if len(self.queue) >= self.maxlen:
+                if self.policy == 'block':
+                    # Backpressure, the publisher waits for this subscriber
+                    self.cond.wait_for(lambda: len(self.queue) < self.maxlen or self.closed,
+                                       self.block_timeout)
+                if self.policy == 'disconnect':
+                    self.dropped += n + sum(m for m, _ in self.queue)
+                    self._close()
+                    return
+                if self.policy == 'drop_oldest':
+                    self.dropped += self.queue.popleft()[0]
+                elif len(self.queue) >= self.maxlen:
+                    # drop_newest, or still full after blocking
+                    self.dropped += n
+                    return
+            if not self.closed:
+                self.queue.append((n, frame))
+                self.cond.notify_all()
+
+    def run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.queue or self.closed)
+                if self.closed:
+                    return
+                n, frame = self.queue.popleft()
+                self.cond.notify_all()
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                self.close()
+                return
+            self.sent += n
+
+    def _close(self):
+        self.closed = True
+        self.queue.clear()
+        self.cond.notify_all()
+        _shutdown(self.sock)
+
+    def close(self):
+        with self.cond:
+            self._close()
+
+
+class Publisher:
+    '''Serve sample batches to every connected subscriber.
+
+    Each batch is encoded once and queued for each subscriber, whose own
+    thread sends it, so a slow subscriber never delays the others. When a
+    subscriber's queue holds `maxlen` frames, `policy` decides:
+    'drop_oldest' (live views), 'drop_newest', 'block' (wait up to
+    `block_timeout` seconds for space, for loggers that must not miss
+    data) or 'disconnect'. Dropped samples are counted per subscriber.'''
+    def __init__(self, address, maxlen=256, policy='drop_oldest', block_timeout=0.1):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy {policy!r}, expected one of {POLICIES}")
+        self.family, self.address = parse_address(address)
+        self.maxlen = maxlen
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.clients = []
+        self._lock = threading.Lock()
+        self.closed = False
+
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            # Left behind by a previous run
+            os.unlink(self.address)
+        self.sock = socket.socket(self.family, socket.SOCK_STREAM)
+        if self.family == socket.AF_INET:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.address)
+        self.sock.listen()
+        self.sock.settimeout(0.2)
+        self._thread = threading.Thread(target=self._accept, daemon=True)
+        self._thread.start()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                conn, _ = self.sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            conn.settimeout(None)
+            if self.family == socket.AF_INET:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            client = _Client(conn, self.maxlen, self.policy, self.block_timeout)
+            client.start()
+            with self._lock:
+                self.clients.append(client)
+
+    def publish(self, time_ms, weight):
+        '''Send a batch of (device time in ms, weight) to all subscribers.'''
+        n = len(time_ms)
+        if n == 0:
+            return
+        frame = encode(time_ms, weight)
+        with self._lock:
+            self.clients = [c for c in self.clients if not c.closed]
+            clients = list(self.clients)
+        for client in clients:
+            client.put(n, frame)
+
+    def stats(self):
+        with self._lock:
+            return [{'sent': c.sent, 'dropped': c.dropped, 'closed': c.closed} for c in self.clients]
+
+    def close(self):
+        self.closed = True
+        self.sock.close()
+        self._thread.join(1)
+        with self._lock:
+            for client in self.clients:
+                client.close()
+        if self.family == socket.AF_UNIX and os.path.exists(self.address):
+            os.unlink(self.address)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class Subscriber(threading.Thread):
+    '''Receive a `Publisher`'s batches on a background thread.
+
+    Works like `SerialReader`: batches wait in a queue bounded to `maxlen`
+    samples (the oldest are dropped and counted) until `drain` collects
+    them, so `scale.update(subscriber.drain())` consumes the stream.'''
+    def __init__(self, address, maxlen=100000, timeout=5):
+        super().__init__(daemon=True)
+        family, address = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        # The publisher may still be starting up
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                self.sock.connect(address)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.perf_counter() > deadline:
+                    raise
+                time.sleep(0.05)
+        self.maxlen = maxlen
+        self.queue = collections.deque()
+        self.queued = 0
+        self.received = 0
+        self.dropped = 0
+        self.connected = True
+        self._lock = threading.Lock()
+        self.start()
+
+    def run(self):
+        try:
+            while True:
+                magic, version, n = HEADER.unpack(_recv_exact(self.sock, HEADER.size))
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"Unexpected frame header {magic!r} version {version}.")
+                time_ms, weight = decode(n, _recv_exact(self.sock, 12*n))
+                with self._lock:
+                    self.queue.append((time_ms, weight))
+                    self.queued += n
+                    self.received += n
+                    while self.queued > self.maxlen:
+                        old_ms, _ = self.queue.popleft()
+                        self.queued -= len(old_ms)
+                        self.dropped += len(old_ms)
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            self.connected = False
+
+    def drain(self):
+        '''(device time in ms, weight) arrays of everything received since
+        the last call.'''
+        with self._lock:
+            batches = list(self.queue)
+            self.queue.clear()
+            self.queued = 0
+        if not batches:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate([ms for ms, _ in batches]), np.concatenate([w for _, w in batches])
+
+    def stream(self, interval=0.1):
+        '''Yield drained batches every `interval` seconds until the
+        publisher goes away.'''
+        while self.connected or self.queue:
+            time.sleep(interval)
+            yield self.drain()
+
+    def close(self):
+        _shutdown(self.sock)
+        self.join(1)
+
+
+if __name__ == '__main__':
+    # Print what a publisher sends, e.g. `python pubsub.py /tmp/scale.sock`
+    subscriber = Subscriber(sys.argv[1] if len(sys.argv) > 1 else '/tmp/scale.sock')
+    for time_ms, weight in subscriber.stream(interval=1):
+        if len(weight):
+            print(f'{len(weight)} samples up to {time_ms[-1]} ms, last {weight[-1]:.2f} kg, '
+                  f'max {weight.max():.2f} kg', flush=True)
+    print(f'Publisher closed, received {subscriber.received} samples, dropped {subscriber.dropped}')
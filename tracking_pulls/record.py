@@ -0,0 +1,142 @@
+'''Headless recording, for a rig without a display.
+
+    python record.py --name dilraj --arm left --hold 20
+    python record.py --simulate --duration 10 --data-file /tmp/test.hdf5
+
+Records until Ctrl-C (or SIGTERM, or `--duration` seconds) into the same
+HDF5 layout as `scale_stream_plot.py`. Only the acquisition core is
+imported up front; h5py is loaded while the board boots and streams,
+matplotlib is never imported and scipy only for the closing summary.
+The startup timings, including the time to the first sample, are printed
+and stored with the session.
+'''
+import time
+# Taken before the other imports, so their cost shows in the startup report
+T_START = time.perf_counter()
+
+import signal
+import argparse
+import datetime
+
+from scale_core import Scale, timing_stats
+
+T_IMPORTED = time.perf_counter()
+
+# Seconds of samples kept in memory, the data file holds the whole session
+BUFFER_SECONDS = 300
+
+
+def group_name(when):
+    return f'{when.day}-{when.month}-{when.year}/{when.hour}:{when.minute}:{when.second}'
+
+
+def stop_on_sigterm():
+    '''Let `kill`/systemd stop a recording as cleanly as Ctrl-C.'''
+    def handler(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, handler)
+
+
+def record(scale, duration=None, interval=0.1, status_interval=5, quiet=False):
+    '''Move samples from the reader into `scale` (and its writer) until
+    `duration` seconds have passed or the recording is interrupted.'''
+    frames = scale.reader_stream()
+    start = time.perf_counter()
+    next_status = start + status_interval
+    try:
+        while duration is None or time.perf_counter() - start < duration:
+            time.sleep(interval)
+            scale.update(next(frames))
+            if not quiet and time.perf_counter() >= next_status:
+                next_status += status_interval
+                live = scale.analytics.summary()
+                print(f'{scale.samples.total} samples, peak {live["peak_force"]:.1f} kg, '
+                      f'{live["pulls"]} pull(s), dropped {scale.reader.dropped}', flush=True)
+    except KeyboardInterrupt:
+        pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Record a session without a display.')
+    parser.add_argument('--name', default='')
+    parser.add_argument('--arm', default='', help='left/right/both')
+    parser.add_argument('--hold', default='', help='hold size in mm')
+    parser.add_argument('--data-file', default='./recorded_data.hdf5')
+    parser.add_argument('--port', help='serial port (default: first Arduino found)')
+    parser.add_argument('--delay', type=int, default=100, help='ms between samples')
+    parser.add_argument('--duration', type=float, help='seconds to record (default: until stopped)')
+    parser.add_argument('--binary', action='store_true', help='use STREAM_BINARY packets')
+    parser.add_argument('--simulate', action='store_true', help='record from a SimulatedScale')
+    parser.add_argument('--stats', action='store_true', help='record hot path timings too')
+    parser.add_argument('--publish', metavar='ADDRESS',
+                        help='also serve the samples on a Unix socket path or host:port')
+    parser.add_argument('--quiet', action='store_true')
+    args = parser.parse_args(argv)
+    stop_on_sigterm()
+
+    scale = Scale(None, 0, dt=args.delay / 1000, debug=args.stats,
+                  maxlen=int(BUFFER_SECONDS * 1000 / max(args.delay, 1)))
+    if args.simulate:
+        from simulator import SimulatedScale
+        arduino = SimulatedScale(timeout=0.1)
+    else:
+        import serial
+        scale.port = args.port
+        arduino = serial.Serial(scale.find_arduino(), baudrate=115200, timeout=0.1)
+    scale.set_arduino(arduino)
+    scale.set_binary(args.binary)
+    ready = scale.connect()
+    if args.publish:
+        from pubsub import Publisher
+        scale.publisher = Publisher(args.publish)
+    scale.start_reader(delay=args.delay)
+
+    # h5py loads while the reader is already collecting samples
+    from session_writer import SessionWriter
+    from catalog import Catalog
+    name = group_name(datetime.datetime.now())
+    scale.writer = SessionWriter(args.data_file, name, attrs={
+        'arm_used': args.arm,
+        'hold_size_mm': args.hold,
+        'name': args.name,
+        'sample_rate': 1 / scale.dt,
+    }, catalog=Catalog(args.data_file))
+    if not args.quiet:
+        print(f'Recording {name} to {args.data_file}, Ctrl-C to stop', flush=True)
+
+    complete = False
+    try:
+        record(scale, args.duration, quiet=args.quiet)
+        complete = True
+    finally:
+        scale.stop_reader()
+        # Whatever arrived since the last frame
+        scale.update(scale.reader.drain())
+        arduino.close()
+        if scale.publisher is not None:
+            scale.publisher.close()
+        startup = {
+            'import_time': T_IMPORTED - T_START,
+            'ready_time': ready,
+            'time_to_first_sample': scale.time_to_first_sample if scale.time_to_first_sample is not None else -1.0,
+            'first_sample_after_start': scale.host_t0 - T_START if scale.host_t0 is not None else -1.0,
+        }
+        # Over every stored timestamp, not just the buffered minutes
+        attrs = timing_stats(scale.writer.datasets['time_ms'][:], *scale.arrivals())
+        attrs.update(startup)
+        attrs.update(scale.reader.stats())
+        if args.stats:
+            attrs.update(scale.perf_attrs())
+        scale.writer.close(complete=complete, attrs=attrs)
+
+    print(f'Imports took {startup["import_time"]:.2f} s, scale ready after {ready:.2f} s, '
+          f'first sample {startup["first_sample_after_start"]:.2f} s after start')
+    summary = scale.writer.summary
+    print(f'Saved {scale.samples.total} samples: peak {summary["peak_force"]:.2f} kg, '
+          f'{len(scale.writer.reps)} rep(s), reader {scale.reader.stats()}')
+    if args.stats:
+        print(scale.instruments.report())
+
+
+if __name__ == '__main__':
+    main()
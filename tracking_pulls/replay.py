@@ -0,0 +1,148 @@
+import argparse
+
+import numpy as np
+
+from simulator import SimulatedScale, STREAM, STREAM_BINARY
+from session_reader import SessionReader, _search
+
+
+class ReplayScale(SimulatedScale):
+    '''Serial-like source that plays back a recorded session.
+
+    It answers the firmware's commands like `SimulatedScale`, but the
+    stream consists of the session's samples with their recorded device
+    timestamps, paced by those timestamps at `speed` times real time, or
+    as fast as the reader takes them with `speed=None`. The session is
+    read `chunk_size` samples at a time, so sessions of any length can be
+    replayed. `seek` jumps to another point of the recording; the
+    replayed timestamps jump with it, so seek before streaming (or reset
+    the `Scale`) to keep its time axis increasing.'''
+    def __init__(self, session, speed=1.0, chunk_size=4096, timeout=None):
+        self.session = session
+        self.time_ms = session.grp['time_ms'] if 'time_ms' in session.grp else None
+        self.fast = speed is None
+        self.chunk_size = chunk_size
+        self.pos = 0
+        self.base_ms = 0
+        self.chunk_start = 0
+        self.chunk_ms = np.empty(0, dtype=np.int64)
+        self.chunk_w = np.empty(0)
+        super().__init__(noise=0, speed=1.0 if speed is None else speed, timeout=timeout)
+
+    def __len__(self):
+        return len(self.session)
+
+    @property
+    def finished(self):
+        '''Whether everything has been replayed and read.'''
+        return self.pos >= len(self) and not self.out
+
+    @property
+    def position(self):
+        '''Recording time (s) of the next sample to be replayed.'''
+        if self.pos >= len(self):
+            return float(self.session.tdata[len(self) - 1]) if len(self) else 0.0
+        return float(self.session.tdata[self.pos])
+
+    def _chunk(self):
+        '''Recorded (ms, weight) from `pos` to the end of its chunk.'''
+        i = self.pos - self.chunk_start
+        if not 0 <= i < len(self.chunk_ms):
+            stop = min(self.pos + self.chunk_size, len(self))
+            self.chunk_w = np.asarray(self.session.wdata[self.pos:stop], dtype=np.float64)
+            if self.time_ms is not None:
+                self.chunk_ms = np.asarray(self.time_ms[self.pos:stop], dtype=np.int64)
+            else:
+                # Older sessions only have times in seconds
+                tdata = np.asarray(self.session.tdata[self.pos:stop], dtype=np.float64)
+                self.chunk_ms = np.round(tdata * 1000).astype(np.int64)
+            self.chunk_start = self.pos
+            i = 0
+        return self.chunk_ms[i:], self.chunk_w[i:]
+
+    def _rebase(self):
+        '''Pace the replay from the current position onwards.'''
+        self.stream_start = self.millis()
+        self.base_ms = self._chunk()[0][0] if self.pos < len(self) else 0
+
+    def start_stream(self):
+        super().start_stream()
+        self._rebase()
+
+    def seek(self, t):
+        '''Continue the replay from recording time `t` seconds.'''
+        with self._lock:
+            self.pos = _search(self.session.tdata, t)
+            self.out.clear()
+            if self.mode in (STREAM, STREAM_BINARY):
+                self._rebase()
+
+    def weights(self, t_ms):
+        # Single readings and tare use the sample at the current position
+        if len(self) == 0:
+            return np.zeros(np.shape(t_ms))
+        w = self.session.wdata[min(self.pos, len(self) - 1)]
+        return np.full(np.shape(t_ms), w) - self.offset
+
+    def due(self, now):
+        if self.fast and len(self.out) > 32 * self.chunk_size:
+            # The reader is behind, wait for it like a full serial buffer
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        out_ms, out_w = [], []
+        while self.pos < len(self):
+            ms, w = self._chunk()
+            if self.fast:
+                n = len(ms)
+            else:
+                n = int(np.searchsorted(ms - self.base_ms, now - self.stream_start, 'right'))
+            out_ms.append(ms[:n])
+            out_w.append(w[:n] - self.offset)
+            self.pos += n
+            if self.fast or n < len(ms):
+                break
+        if not out_ms:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return np.concatenate(out_ms), np.concatenate(out_w)
+
+
+if __name__ == '__main__':
+    import matplotlib.pyplot as plt
+    from catalog import Catalog
+    from scale_core import Scale
+
+    parser = argparse.ArgumentParser(description='Replay a recorded session through the live plot.')
+    parser.add_argument('session', nargs='?', help='group path (default: latest complete session)')
+    parser.add_argument('--data-file', default='./recorded_data.hdf5')
+    parser.add_argument('--speed', type=float, default=1.0, help='times real time, 0 for as fast as possible')
+    parser.add_argument('--start', type=float, default=0.0, help='seek to this time (s) first')
+    parser.add_argument('--binary', action='store_true', help='replay as STREAM_BINARY packets')
+    parser.add_argument('--window', type=float, help='scrolling plot window in seconds')
+    parser.add_argument('--stats', action='store_true', help='show the timing overlay')
+    args = parser.parse_args()
+
+    path = args.session or Catalog(args.data_file).latest(complete=True)['path']
+    with SessionReader(args.data_file) as reader:
+        session = reader.session(path)
+        device = ReplayScale(session, speed=args.speed or None, timeout=0.1)
+        device.seek(args.start)
+
+        fig, ax = plt.subplots()
+        ax.set_title(f'Replay of {path}')
+        scale = Scale(ax, 10, debug=True, window=args.window, overlay=args.stats)
+        scale.set_arduino(device)
+        scale.set_binary(args.binary)
+        scale.connect()
+        scale.start_reader()
+        frames = scale.reader_stream()
+        timer = fig.canvas.new_timer(interval=100)
+        timer.add_callback(lambda: scale.update(next(frames)))
+        timer.start()
+        plt.show()
+        scale.stop_reader()
+
+        print(scale.instruments.report())
+        live = scale.analytics.summary()
+        stored = session.summary()
+        print(f"Replayed {scale.samples.total} of {len(device)} samples: "
+              f"peak {live['peak_force']:.2f} kg (stored {stored['peak_force']:.2f}), "
+              f"max RFD {live['max_rfd']:.1f} kg/s, {live['pulls']} pull(s)")
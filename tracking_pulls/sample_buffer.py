@@ -0,0 +1,91 @@
+import numpy as np
+
+
+class SampleBuffer:
+    '''Preallocated store for (time, weight, device timestamp) samples.
+
+    Samples are written into NumPy arrays that double in size when full,
+    so appends are amortized O(1). With `maxlen` set the buffer instead
+    keeps only the most recent `maxlen` samples.'''
+    def __init__(self, capacity=1024, maxlen=None):
+        if maxlen is not None:
+            capacity = maxlen
+        self.maxlen = maxlen
+        # Ring mode keeps a second copy of every sample so the last
+        # `maxlen` values are always one contiguous slice.
+        size = 2*capacity if maxlen is not None else capacity
+        self._t = np.empty(size, dtype=np.float64)
+        self._w = np.empty(size, dtype=np.float64)
+        self._ms = np.empty(size, dtype=np.int64)
+        self._start = 0
+        self._n = 0
+        self.total = 0
+
+    def __len__(self):
+        return self._n
+
+    def _grow(self, needed):
+        size = len(self._t)
+        while size < needed:
+            size *= 2
+        for name in ('_t', '_w', '_ms'):
+            old = getattr(self, name)
+            new = np.empty(size, dtype=old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, name, new)
+
+    def append(self, t, w, ms=0):
+        '''Add a single sample.'''
+        self.extend([t], [w], [ms])
+
+    def extend(self, t, w, ms=None):
+        '''Add a batch of samples from array-likes of equal length.'''
+        t = np.asarray(t, dtype=np.float64)
+        w = np.asarray(w, dtype=np.float64)
+        ms = np.zeros(len(t), dtype=np.int64) if ms is None else np.asarray(ms, dtype=np.int64)
+        n = len(t)
+        if n == 0:
+            return
+        self.total += n
+        if self.maxlen is None:
+            if self._n + n > len(self._t):
+                self._grow(self._n + n)
+            self._t[self._n:self._n + n] = t
+            self._w[self._n:self._n + n] = w
+            self._ms[self._n:self._n + n] = ms
+            self._n += n
+            return
+
+        # Ring mode: only the newest `maxlen` samples of the batch matter
+        cap = self.maxlen
+        if n > cap:
+            t, w, ms = t[-cap:], w[-cap:], ms[-cap:]
+            n = cap
+        end = self._start + self._n
+        idx = (end + np.arange(n)) % cap
+        for src, dst in ((t, self._t), (w, self._w), (ms, self._ms)):
+            # Mirror both halves so [start:start+n] stays contiguous
+            dst[idx] = src
+            dst[idx + cap] = src
+        self._n = min(self._n + n, cap)
+        self._start = (end + n - self._n) % cap
+
+    def clear(self):
+        self._start = 0
+        self._n = 0
+        self.total = 0
+
+    @property
+    def t(self):
+        '''View of the stored sample times.'''
+        return self._t[self._start:self._start + self._n]
+
+    @property
+    def w(self):
+        '''View of the stored weights.'''
+        return self._w[self._start:self._start + self._n]
+
+    @property
+    def ms(self):
+        '''View of the stored device timestamps.'''
+        return self._ms[self._start:self._start + self._n]
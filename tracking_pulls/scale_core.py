@@ -0,0 +1,346 @@
+import time
+
+import numpy as np
+
+from sample_buffer import SampleBuffer
+from serial_reader import SerialReader
+from parsing import ChunkParser, BinaryParser, PACKET
+from analysis import OnlineAnalytics
+from instrumentation import Instruments
+
+class Scale:
+    def __init__(self, ax, tlim, dt=0.1, debug=False, maxlen=None, window=None, overlay=False):
+        self.port = None
+        self.arduino = None
+        self.reader = None
+        self.writer = None
+        # Optional `pubsub.Publisher` that gets every decoded batch
+        self.publisher = None
+        self.binary = False
+        self.parser = ChunkParser()
+        self.dt = dt
+        self.ax = ax
+        self.maxw = -np.inf
+        self.samples = SampleBuffer(maxlen=maxlen)
+        # First device timestamp
+        self.t0_ms = None
+        # (device time in ms, host time) of the first and latest batch, see
+        # `arrivals`; only used without a reader, which stamps them itself
+        self.first_arrival = None
+        self.last_arrival = None
+        # Set by `connect`, see `time_to_first_sample`
+        self.t_connect = None
+        self.ready_time = None
+        # Without axes the scale only acquires, e.g. under `DeviceManager`
+        # or `record.py`, and matplotlib is never imported
+        self.plot = None
+        if ax is not None:
+            from live_plot import LivePlot
+            self.plot = LivePlot(ax, tlim, window=window)
+        self.analytics = OnlineAnalytics()
+        self.line = self.plot.line if self.plot is not None else None
+        self.debug = debug
+        # Hot path timings, recorded when debugging or showing the overlay
+        self.instruments = Instruments(enabled=debug or overlay)
+        self.overlay = overlay
+        self.overlay_text = ''
+        self.overlay_time = 0
+        
+        self.HANDSHAKE = 0
+        self.VOLTAGE_REQUEST = 1
+        self.ON_REQUEST = 2
+        self.STREAM = 3
+        self.READ_DAQ_DELAY = 4
+        self.TARE = 5
+        self.STREAM_BINARY = 6
+
+    @property
+    def tdata(self):
+        return self.samples.t
+
+    @property
+    def wdata(self):
+        return self.samples.w
+
+    def set_arduino(self, arduino):
+        self.arduino = arduino
+
+    def set_lims(self, xlims, ylims):
+        self.plot.set_lims(xlims, ylims)
+        
+    def update(self, frame):
+        '''Add a batch of samples to the plot.
+
+        `frame` is a (device time in ms, weight) pair of arrays as yielded by
+        `daq_stream`/`reader_stream`. A bare weight or array of weights is
+        also accepted, and is then spaced `self.dt` apart.'''
+        if isinstance(frame, tuple):
+            time_ms, y = np.atleast_1d(*frame)
+        else:
+            time_ms, y = None, np.atleast_1d(frame)
+        if len(y) == 0:
+            return self.artists()
+        self.maxw = max(self.maxw, y.max())
+
+        if time_ms is None:
+            # This slightly more complex calculation avoids floating-point
+            # issues from just repeatedly adding `self.dt` to the previous
+            # value. The running total keeps it right once a bounded buffer
+            # drops samples.
+            t = (self.samples.total + np.arange(len(y))) * self.dt
+            time_ms = np.round(t*1000)
+        else:
+            if self.reader is None:
+                self.last_arrival = (int(time_ms[-1]), time.perf_counter())
+                if self.first_arrival is None:
+                    self.first_arrival = self.last_arrival
+            if self.t0_ms is None:
+                self.t0_ms = time_ms[0]
+            t = (time_ms - self.t0_ms) / 1000
+
+        with self.instruments.time('append'):
+            self.samples.extend(t, y, time_ms)
+            self.analytics.update(t, y)
+        if self.writer is not None:
+            with self.instruments.time('save'):
+                self.writer.append(t, y, time_ms)
+        if self.publisher is not None:
+            with self.instruments.time('publish'):
+                self.publisher.publish(time_ms, y)
+        if self.plot is None:
+            return ()
+        text = (
+            f'peak {self.analytics.peak:.1f} kg   RFD {self.analytics.slope:.1f} kg/s'
+            f'   max RFD {self.analytics.max_rfd:.1f} kg/s'
+        )
+        if self.overlay:
+            # Refreshed twice a second so it stays readable
+            now = time.perf_counter()
+            if now - self.overlay_time > 0.5:
+                self.overlay_text = self.instruments.report()
+                self.overlay_time = now
+            text += '\n' + self.overlay_text
+        self.plot.set_text(text)
+        redraws = self.plot.redraws
+        with self.instruments.time('draw'):
+            artists = self.plot.update(self.tdata, self.wdata, self.maxw, len(y))
+        self.instruments.count('redraws', self.plot.redraws - redraws)
+        return artists
+
+    def artists(self):
+        return (self.line, self.plot.text) if self.plot is not None else ()
+
+    def arrivals(self):
+        '''(device time in ms, host time) pairs of the first and latest
+        samples. The reader stamps batches as they come off the port; without
+        one they are stamped when `update` gets them.'''
+        if self.reader is not None and self.reader.first_arrival is not None:
+            return self.reader.first_arrival, self.reader.last_arrival
+        return self.first_arrival, self.last_arrival
+
+    @property
+    def host_t0(self):
+        '''Host clock (perf_counter) when the first sample arrived.'''
+        first, _ = self.arrivals()
+        return first[1] if first is not None else None
+
+    @property
+    def time_to_first_sample(self):
+        '''Seconds from `connect` until the first sample was received.'''
+        if self.t_connect is None or self.host_t0 is None:
+            return None
+        return self.host_t0 - self.t_connect
+
+    def timing_stats(self):
+        '''Sample interval and clock drift statistics of the device timestamps.'''
+        return timing_stats(self.samples.ms, *self.arrivals())
+
+    def perf_stats(self):
+        '''Hot path timings and counters, see `Instruments.stats`.'''
+        self.instruments.set('malformed', self.parser.malformed)
+        self.instruments.set('samples', self.samples.total)
+        if self.reader is not None:
+            self.instruments.set('dropped', self.reader.dropped)
+        return self.instruments.stats()
+
+    def perf_attrs(self):
+        '''`perf_stats` flattened for the session group's attributes.'''
+        self.perf_stats()
+        return self.instruments.attrs()
+
+
+    def find_arduino(self):
+        '''Get the name of the port that is connected to Arduino.'''
+        if self.port is None:
+            ports = find_arduinos()
+            if not ports:
+                raise IOError("No Arduino found on any serial port.")
+            self.port = ports[-1]
+        return self.port
+
+    def wait_for(self, text, timeout):
+        '''Read lines until one contains `text`, or any of a tuple of
+        texts. Returns that line, or None if nothing matching arrived within
+        `timeout` seconds.'''
+        texts = text if isinstance(text, tuple) else (text,)
+        deadline = time.perf_counter() + timeout
+        while time.perf_counter() < deadline:
+            line = self.arduino.read_until()
+            if any(t in line for t in texts):
+                return line
+        return None
+
+    def connect(self, timeout=5):
+        '''Wait until the board on a freshly opened port is ready.
+
+        A handshake is sent straight away, so a board that does not reset
+        when the port opens answers it at once and is then tared. One that
+        does reset tares the scale itself and prints its setup banner
+        instead, so whichever comes first means it is ready. Returns the
+        time that took.'''
+        self.t_connect = time.perf_counter()
+        self.arduino.write(bytes([self.HANDSHAKE]))
+        line = self.wait_for((b"Ready to be called", b"Message received"), timeout)
+        if line is None:
+            raise IOError(f"No reply from Arduino within {timeout} s.")
+        if b"Ready to be called" in line:
+            # A handshake that arrived during setup is answered right after
+            # the banner; take the reply so it doesn't end up in the stream
+            self.wait_for(b"Message received", 0.1)
+        elif not self.tare(timeout):
+            # No reset, so setup() never zeroed the scale for this session
+            raise IOError(f"Arduino did not acknowledge the tare within {timeout} s.")
+        self.ready_time = time.perf_counter() - self.t_connect
+        return self.ready_time
+
+    def tare(self, timeout=5):
+        '''Zero the scale over the open connection. Returns whether the
+        board acknowledged it.'''
+        self.arduino.write(bytes([self.TARE]))
+        return self.wait_for(b"Tare done", timeout) is not None
+
+    def handshake_arduino(self, timeout=2, print_handshake_message=False):
+        '''Make sure connection is established by sending
+        and receiving bytes.'''
+        self.arduino.write(bytes([self.HANDSHAKE]))
+        handshake_message = self.wait_for(b"Message received", timeout)
+        if handshake_message is None:
+            raise IOError(f"No handshake reply from Arduino within {timeout} s.")
+
+        # Print the handshake message, if desired
+        if print_handshake_message:
+            print("Handshake message: " + handshake_message.decode())
+        return 1
+
+    def parse_raw(self, raw):
+        '''Parse bytes output from Arduino.'''
+        raw = raw.decode()
+        if raw[-1] != "\n":
+            raise ValueError(
+                "Input must end with newline, otherwise message is incomplete."
+            )
+
+        t, W = raw.rstrip().split(",")
+        return int(t), float(W) 
+
+    def set_binary(self, binary):
+        '''Choose between the text stream and the STREAM_BINARY packets.'''
+        self.binary = binary
+        self.parser = BinaryParser() if binary else ChunkParser()
+
+    def start_stream(self, delay=100):
+        '''Set the delay between samples and turn on the stream.'''
+        self.arduino.write(bytes([self.READ_DAQ_DELAY]) + (str(delay) + "x").encode())
+        self.parser.reset()
+        self.arduino.write(bytes([self.STREAM_BINARY if self.binary else self.STREAM]))
+
+    def read_chunk(self):
+        '''Block for one line or packet, then take whatever else is waiting.
+        The blocking part is timed as 'wait', the rest as 'read'.'''
+        with self.instruments.time('wait'):
+            if self.binary:
+                raw = self.arduino.read(PACKET.itemsize)
+            else:
+                raw = self.arduino.read_until()
+        with self.instruments.time('read'):
+            if self.arduino.in_waiting:
+                raw += self.arduino.read(self.arduino.in_waiting)
+        return raw
+
+    def daq_read(self, n_data=1, delay=100):
+        '''Obtain `n_data` data points from an Arduino stream
+        with a delay of `delay` milliseconds between each.'''
+        # Initialize output
+        time_ms = np.empty(n_data)
+        weight = np.empty(n_data)
+
+        # Specify delay and turn on the stream
+        self.start_stream(delay)
+
+        # Receive data
+        i = 0
+        while i < n_data:
+            raw = self.read_chunk()
+            with self.instruments.time('parse'):
+                t, W = self.parser.feed(raw)
+            n = min(len(t), n_data - i)
+            time_ms[i:i + n] = t[:n]
+            weight[i:i + n] = W[:n]
+            i += n
+
+        # Turn off the stream
+        self.arduino.write(bytes([self.ON_REQUEST]))
+
+        return time_ms, weight
+
+    def daq_stream(self, delay=100):
+        '''Provide iterable source of data batches'''
+        self.start_stream(delay)
+        while True:
+            raw = self.read_chunk()
+            with self.instruments.time('parse'):
+                batch = self.parser.feed(raw)
+            yield batch
+
+    def start_reader(self, delay=100):
+        '''Start streaming into a background `SerialReader`.'''
+        self.start_stream(delay)
+        self.reader = SerialReader(self.arduino, self.parser, instruments=self.instruments)
+        self.reader.start()
+        return self.reader
+
+    def stop_reader(self):
+        if self.reader is not None:
+            self.reader.stop()
+            self.arduino.write(bytes([self.ON_REQUEST]))
+
+    def reader_stream(self):
+        '''Provide iterable source of data batches from the reader thread'''
+        while True:
+            yield self.reader.drain()
+        
+def find_arduinos():
+    '''Names of all ports that are connected to an Arduino.'''
+    import serial.tools.list_ports
+    return [
+        p.device for p in serial.tools.list_ports.comports()
+        if p.manufacturer is not None and "Arduino" in p.manufacturer
+    ]
+
+def timing_stats(time_ms, first=None, last=None):
+    '''Interval statistics for device timestamps in ms. If (device time in
+    ms, host arrival time) pairs of the first and last samples are given,
+    also estimate the drift of the device clock relative to the host in
+    parts per million.'''
+    intervals = np.diff(time_ms) / 1000
+    stats = {
+        'dt_mean': intervals.mean() if len(intervals) else np.nan,
+        'dt_jitter': intervals.std() if len(intervals) else np.nan,
+        'dt_max': intervals.max() if len(intervals) else np.nan,
+        'clock_drift_ppm': np.nan,
+    }
+    if first is not None and last is not None and last[1] > first[1]:
+        device_elapsed = (last[0] - first[0]) / 1000
+        host_elapsed = last[1] - first[1]
+        stats['clock_drift_ppm'] = (device_elapsed - host_elapsed) / host_elapsed * 1e6
+    return stats
@@ -0,0 +1,151 @@
+import numpy as np
+
+from analysis import session_times
+
+# One row of the per-rep table stored next to the raw data
+REP = np.dtype([
+    ('start_index', np.int64),
+    ('end_index', np.int64),
+    ('t_start', np.float64),
+    ('t_end', np.float64),
+    ('duration', np.float64),
+    ('peak_force', np.float64),
+    ('time_to_peak', np.float64),
+    ('mean_force', np.float64),
+    ('max_rfd', np.float64),
+    ('impulse', np.float64),
+])
+
+
+def hysteresis(x, high, low, initial=False):
+    '''Boolean state that turns on where `x > high`, off where `x < low`
+    and otherwise keeps its previous value.'''
+    marks = np.where(x > high, 1, np.where(x < low, 0, -1))
+    # Forward fill the last decided position
+    last = np.where(marks >= 0, np.arange(len(x)), -1)
+    last = np.maximum.accumulate(last) if len(x) else last
+    return np.where(last >= 0, marks[last] == 1, initial)
+
+
+class PullSegmenter:
+    '''Find every pull (rep) in a continuous recording, chunk by chunk.
+
+    A rep is active while the force is above `on_threshold` until it drops
+    below `off_threshold`. Its start is then moved back to where the slope
+    last rose above `slope_threshold`, so the rise is included. Reps
+    shorter than `min_duration` seconds are discarded. Only the current
+    chunk and a few scalars are held in memory, so recordings of any
+    length can be segmented.'''
+    def __init__(self, on_threshold=2.0, off_threshold=1.0, slope_threshold=5.0, min_duration=0.3):
+        self.on_threshold = on_threshold
+        self.off_threshold = off_threshold
+        self.slope_threshold = slope_threshold
+        self.min_duration = min_duration
+        self.n = 0
+        self.t_prev = None
+        self.w_prev = None
+        self.active = False
+        self.last_calm = (0, 0.0)
+        self.rep = None
+        self.reps = []
+
+    def _open(self):
+        calm_index, calm_t = self.last_calm
+        self.rep = {
+            'start_index': calm_index, 't_start': calm_t,
+            'peak_force': -np.inf, 't_peak': calm_t, 'max_rfd': -np.inf,
+            'sum': 0.0, 'count': 0, 'impulse': 0.0,
+        }
+
+    def _close(self, index, t):
+        rep = self.rep
+        self.rep = None
+        duration = t - rep['t_start']
+        if duration < self.min_duration:
+            return
+        self.reps.append((
+            rep['start_index'], index, rep['t_start'], t, duration,
+            rep['peak_force'], rep['t_peak'] - rep['t_start'],
+            rep['sum'] / max(rep['count'], 1), rep['max_rfd'], rep['impulse'],
+        ))
+
+    def feed(self, tdata, wdata):
+        '''Process the next chunk of the recording.'''
+        tdata = np.asarray(tdata, dtype=np.float64)
+        wdata = np.asarray(wdata, dtype=np.float64)
+        n = len(tdata)
+        if n == 0:
+            return
+        index = self.n + np.arange(n)
+
+        # Slope into every sample, continuing from the previous chunk
+        t_ext = np.r_[tdata[0] if self.t_prev is None else self.t_prev, tdata]
+        w_ext = np.r_[wdata[0] if self.w_prev is None else self.w_prev, wdata]
+        dt = np.diff(t_ext)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = np.where(dt > 0, np.diff(w_ext) / dt, 0.0)
+        area = (w_ext[1:] + w_ext[:-1]) / 2 * dt
+
+        state = hysteresis(wdata, self.on_threshold, self.off_threshold, self.active)
+        # Last sample before each position whose slope was not rising
+        calm = np.where(slope <= self.slope_threshold, np.arange(n), -1)
+        calm = np.maximum.accumulate(calm)
+
+        # Runs of constant state inside this chunk
+        edges = np.flatnonzero(np.diff(np.r_[self.active, state].astype(np.int8)))
+        bounds = np.r_[0, edges, n]
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if lo == hi:
+                continue
+            if not state[lo]:
+                if self.rep is not None:
+                    self._close(index[lo], tdata[lo])
+                continue
+            if self.rep is None:
+                c = calm[lo]
+                if c >= 0:
+                    self.last_calm = (index[c], tdata[c])
+                self._open()
+            rep = self.rep
+            seg = slice(lo, hi)
+            peak = np.argmax(wdata[seg])
+            if wdata[seg][peak] > rep['peak_force']:
+                rep['peak_force'] = wdata[seg][peak]
+                rep['t_peak'] = tdata[seg][peak]
+            rep['max_rfd'] = max(rep['max_rfd'], slope[seg].max())
+            rep['sum'] += wdata[seg].sum()
+            rep['count'] += hi - lo
+            rep['impulse'] += area[seg].sum()
+
+        if calm[-1] >= 0:
+            self.last_calm = (index[calm[-1]], tdata[calm[-1]])
+        self.active = bool(state[-1])
+        self.t_prev, self.w_prev = tdata[-1], wdata[-1]
+        self.n += n
+
+    def finish(self):
+        '''Close a rep still open at the end of the recording and return
+        the table of reps.'''
+        if self.rep is not None:
+            self._close(self.n, self.t_prev)
+        return np.array(self.reps, dtype=REP)
+
+
+def segment_pulls(tdata, wdata, chunk_size=65536, **kwargs):
+    '''Segment a whole recording. `tdata` and `wdata` may be HDF5
+    datasets, in which case they are read one chunk at a time.'''
+    segmenter = PullSegmenter(**kwargs)
+    for start in range(0, len(wdata), chunk_size):
+        segmenter.feed(tdata[start:start + chunk_size], wdata[start:start + chunk_size])
+    return segmenter.finish()
+
+
+def write_reps(grp, reps=None, **kwargs):
+    '''Segment a stored session and save the table as its `reps` dataset.'''
+    if reps is None:
+        tdata = grp['tdata'] if 'tdata' in grp else session_times(grp)
+        reps = segment_pulls(tdata, grp['wdata'], **kwargs)
+    if 'reps' in grp:
+        del grp['reps']
+    grp['reps'] = reps
+    return reps
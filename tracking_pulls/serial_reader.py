@@ -0,0 +1,110 @@
+import time
+import threading
+import collections
+
+import numpy as np
+
+from instrumentation import Instruments
+
+
+class SerialReader(threading.Thread):
+    '''Drain a serial port on a background thread.
+
+    Raw chunks are parsed in bulk by `parser` and kept in a bounded queue
+    until `drain` collects them, so acquisition keeps up with the device
+    no matter how slowly the GUI consumes the data. The port should be
+    opened with a finite timeout so `stop` can interrupt a pending read.
+    Reads and parses are timed into `instruments`, if given, with the time
+    spent waiting for data kept apart as the 'wait' stage.'''
+    def __init__(self, arduino, parser, maxlen=100000, late_after=0.5, instruments=None):
+        super().__init__(daemon=True)
+        self.arduino = arduino
+        self.parser = parser
+        self.maxlen = maxlen
+        self.late_after = late_after
+        self.instruments = instruments if instruments is not None else Instruments(enabled=False)
+        self.queue = collections.deque()
+        self.queued = 0
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+        # Counters, readable at any time
+        self.received = 0
+        self.dropped = 0
+        self.late = 0
+
+        # Smallest (host arrival - device time) seen, in seconds. Adding it
+        # to a device timestamp maps it onto the host's perf_counter clock.
+        self.clock_offset = np.inf
+        # (device time in ms, host arrival time) of the newest sample of the
+        # first and of the latest batch, for the drift in `timing_stats`
+        self.first_arrival = None
+        self.last_arrival = None
+
+    @property
+    def malformed(self):
+        return self.parser.malformed
+
+    def read_chunk(self):
+        # Block for the first byte (up to the port timeout), then take
+        # whatever else is already waiting.
+        with self.instruments.time('wait'):
+            chunk = self.arduino.read(1)
+        if chunk:
+            with self.instruments.time('read'):
+                if self.arduino.in_waiting:
+                    chunk += self.arduino.read(self.arduino.in_waiting)
+        return chunk
+
+    def run(self):
+        while not self._stop_event.is_set():
+            chunk = self.read_chunk()
+            if not chunk:
+                # Read timed out, check whether we were asked to stop
+                continue
+            with self.instruments.time('parse'):
+                time_ms, weight = self.parser.feed(chunk)
+            if len(time_ms) == 0:
+                continue
+            arrived = time.perf_counter()
+            self.clock_offset = min(self.clock_offset, arrived - time_ms[-1] / 1000)
+            self.last_arrival = (int(time_ms[-1]), arrived)
+            if self.first_arrival is None:
+                self.first_arrival = self.last_arrival
+            with self._lock:
+                self.queue.append((arrived, time_ms, weight))
+                self.queued += len(time_ms)
+                self.received += len(time_ms)
+                while self.queued > self.maxlen:
+                    _, old_ms, _ = self.queue.popleft()
+                    self.queued -= len(old_ms)
+                    self.dropped += len(old_ms)
+
+    def drain(self):
+        '''Return (device time in ms, weight) arrays of everything received
+        since the last call. Samples that waited longer than `late_after`
+        seconds are counted as late.'''
+        with self._lock:
+            batches = list(self.queue)
+            self.queue.clear()
+            self.queued = 0
+        if not batches:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        now = time.perf_counter()
+        self.late += sum(len(ms) for arrived, ms, _ in batches if now - arrived > self.late_after)
+        time_ms = np.concatenate([ms for _, ms, _ in batches])
+        weight = np.concatenate([w for _, _, w in batches])
+        return time_ms, weight
+
+    def stop(self, timeout=1):
+        self._stop_event.set()
+        self.join(timeout)
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'dropped': self.dropped,
+            'malformed': self.malformed,
+            'late': self.late,
+            'lost': getattr(self.parser, 'lost', 0),
+        }
@@ -0,0 +1,240 @@
+import sys
+import tkinter as tk
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+from catalog import Catalog
+from session_reader import SessionReader
+from decimate import minmax_decimate
+from peaks import PEAK, PEAKS_VERSION, load_peaks, write_peaks, peak_near
+
+# Holds of the beacon board, as in the original sketch
+HOLDS = (3008, 2407, 2408)
+
+
+class SessionBrowser:
+    '''Tk window to step through sessions and through the peaks of each.
+
+    Every session's peak index is loaded once (and cached in the data
+    file by `load_peaks`), so stepping is an index lookup and a window
+    read of a few seconds of samples. The session overview is drawn once
+    per session; a peak step only moves the animated marker and detail
+    line and blits them over the cached background. The data file is only
+    opened, read-only, while a session or peak window is read, and for
+    writing only while labels or a new peak index are saved, so a recorder
+    can keep writing to it while the browser is up.'''
+    def __init__(self, window, data_file, writable=True, span=3.0, pixels=2000):
+        self.window = window
+        self.span = span
+        self.pixels = pixels
+        self.writable = writable
+        self.entries = [e for e in Catalog(data_file).query() if e['n_samples']]
+        if not self.entries:
+            raise ValueError(f"No sessions with data in {data_file}")
+        self.data_file = data_file
+        self.peak_cache = {}
+        self.overview_cache = {}
+        self.peaks = np.zeros(0, dtype=PEAK)
+        self.session_i = len(self.entries) - 1
+        self.peak_i = 0
+        self.background = None
+
+        self.fig = Figure(figsize=(8, 6), dpi=100)
+        self.ax_all, self.ax_peak = self.fig.subplots(2, 1)
+        self.trace, = self.ax_all.plot([], [], lw=0.8)
+        self.ax_all.set_xlabel('time (s)')
+        self.ax_all.set_ylabel('Weight (kg)')
+        self.all_peaks, = self.ax_all.plot([], [], 'x', color='grey')
+        self.marker, = self.ax_all.plot([], [], 'o', color='red', animated=True)
+        self.detail, = self.ax_peak.plot([], [], animated=True)
+        self.detail_marker, = self.ax_peak.plot([], [], 'o', color='red', animated=True)
+        self.info = self.ax_peak.text(0.02, 0.95, '', transform=self.ax_peak.transAxes,
+                                      va='top', animated=True)
+        self.ax_peak.set_xlim(-span, span)
+        self.ax_peak.set_xlabel('time from peak (s)')
+        self.fig.tight_layout()
+
+        plots = tk.LabelFrame(window, text='Plots', padx=5, pady=5)
+        plots.grid(row=0, column=0, sticky=tk.W + tk.N + tk.S + tk.E)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=plots)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+        NavigationToolbar2Tk(self.canvas, plots).update()
+        self.canvas.mpl_connect('draw_event', self._cache_background)
+        self.canvas.mpl_connect('button_press_event', self._click)
+
+        buttons = tk.LabelFrame(window, text='Controls', padx=5, pady=5)
+        buttons.grid(row=0, column=1, sticky=tk.E + tk.N + tk.S)
+        tk.Label(buttons, text='Session').grid(row=0, column=0, sticky=tk.E)
+        tk.Button(buttons, text='<<', command=lambda: self.step_session(-1)).grid(row=1, column=0, sticky=tk.E)
+        tk.Button(buttons, text='>>', command=lambda: self.step_session(1)).grid(row=1, column=1, sticky=tk.E)
+        tk.Label(buttons, text='Change Current Peak').grid(row=2, column=0, sticky=tk.E)
+        tk.Button(buttons, text='<', command=lambda: self.step_peak(-1)).grid(row=3, column=0, sticky=tk.E)
+        tk.Button(buttons, text='>', command=lambda: self.step_peak(1)).grid(row=3, column=1, sticky=tk.E)
+
+        self.hold_choice = tk.IntVar(value=-1)
+        tk.Label(buttons, text='Beacon Label').grid(row=4, column=0, sticky=tk.E)
+        for i, hold in enumerate(HOLDS):
+            tk.Radiobutton(buttons, text=str(hold), variable=self.hold_choice,
+                           value=hold).grid(row=5, column=i, sticky=tk.E)
+        self.valid_choice = tk.IntVar(value=-1)
+        tk.Label(buttons, text='True Peak?').grid(row=6, column=0, sticky=tk.E)
+        tk.Radiobutton(buttons, text='Yes', variable=self.valid_choice, value=1).grid(row=7, column=0, sticky=tk.E)
+        tk.Radiobutton(buttons, text='No', variable=self.valid_choice, value=0).grid(row=7, column=1, sticky=tk.E)
+        tk.Button(buttons, text='Save Entry', command=self.save_entry).grid(row=8, column=0, sticky=tk.E)
+        self.status = tk.Label(buttons, text='', justify=tk.LEFT, wraplength=200)
+        self.status.grid(row=9, column=0, columnspan=3, sticky=tk.W)
+
+        window.bind('<Left>', lambda e: self.step_peak(-1))
+        window.bind('<Right>', lambda e: self.step_peak(1))
+        window.bind('<Prior>', lambda e: self.step_session(-1))
+        window.bind('<Next>', lambda e: self.step_session(1))
+        window.columnconfigure(0, weight=1)
+        window.rowconfigure(0, weight=1)
+
+        self.show_session(self.session_i)
+
+    def _cache_background(self, event):
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in (self.marker, self.detail, self.detail_marker, self.info):
+            artist.axes.draw_artist(artist)
+
+    def _blit(self):
+        if self.background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_animated()
+        self.canvas.blit(self.fig.bbox)
+
+    def session_peaks(self, path):
+        if path not in self.peak_cache:
+            with SessionReader(self.data_file) as reader:
+                grp = reader.hfile[path]
+                stored = 'peaks' in grp and grp.attrs.get('peaks_version') == PEAKS_VERSION
+                peaks = load_peaks(grp)
+            if self.writable and not stored:
+                # Cache the new index, the read-only handle is closed by now
+                self.write_peaks(path, peaks)
+            self.peak_cache[path] = peaks
+        return self.peak_cache[path]
+
+    def write_peaks(self, path, peaks):
+        '''Store `peaks` as the index of session `path`, False if a
+        recorder holds the data file.'''
+        try:
+            with SessionReader(self.data_file, 'r+') as reader:
+                write_peaks(reader.hfile[path], peaks)
+        except OSError:
+            return False
+        return True
+
+    def overview(self, session):
+        '''Session trace reduced to about `pixels` min/max pairs.'''
+        path = session.path
+        if path not in self.overview_cache:
+            t, w = session.window()
+            t = np.asarray(t, dtype=np.float64)
+            w = np.asarray(w, dtype=np.float64)
+            if len(t) > 2 * self.pixels:
+                t, w = minmax_decimate(t, w, (t[-1] - t[0]) / self.pixels, t[0])
+            self.overview_cache[path] = t, w
+        return self.overview_cache[path]
+
+    def show_session(self, i):
+        '''Switch to session `i`, a full redraw.'''
+        entry = self.entries[i]
+        try:
+            peaks = self.session_peaks(entry['path'])
+            with SessionReader(self.data_file) as reader:
+                session = reader.session(entry['path'])
+                t, w = self.overview(session)
+                self.peaks, self.peak_i = peaks, 0
+                self._update_peak(session)
+        except OSError:
+            # Locked by a recorder that is just starting up or closing
+            self.status.config(text='Data file busy, try again.')
+            return
+        self.session_i = i
+        self.trace.set_data(t, w)
+        self.all_peaks.set_data(self.peaks['t'], self.peaks['weight'])
+        self.ax_all.set_xlim(t[0], t[-1] if t[-1] > t[0] else t[0] + 1)
+        ylims = (min(w.min(), 0) - 1, w.max() * 1.1 + 1)
+        self.ax_all.set_ylim(*ylims)
+        self.ax_peak.set_ylim(*ylims)
+        self.ax_all.set_title(f"{entry['path']}  {entry['name'] or ''} "
+                              f"{entry['arm_used'] or ''}  ({i + 1}/{len(self.entries)})")
+        # The background changes, `_cache_background` stores the new one
+        self.canvas.draw()
+
+    def _update_peak(self, session):
+        if len(self.peaks) == 0:
+            for artist in (self.marker, self.detail, self.detail_marker):
+                artist.set_data([], [])
+            self.info.set_text('no peaks')
+            return
+        peak = self.peaks[self.peak_i]
+        start, stop = session.index_range(peak['t'] - self.span, peak['t'] + self.span)
+        t = np.asarray(session.tdata[start:stop], dtype=np.float64)
+        w = np.asarray(session.wdata[start:stop], dtype=np.float64)
+        self.marker.set_data([peak['t']], [peak['weight']])
+        self.detail.set_data(t - peak['t'], w)
+        self.detail_marker.set_data([0], [peak['weight']])
+        self.info.set_text(f"peak {self.peak_i + 1}/{len(self.peaks)}: {peak['weight']:.1f} kg "
+                           f"at {peak['t']:.1f} s")
+        self.hold_choice.set(int(peak['hold']))
+        self.valid_choice.set(int(peak['valid']))
+
+    def show_peak(self, i):
+        '''Move to peak `i` of the session, redrawing only the animated artists.'''
+        if len(self.peaks) == 0:
+            return
+        i = min(max(i, 0), len(self.peaks) - 1)
+        try:
+            with SessionReader(self.data_file) as reader:
+                self.peak_i = i
+                self._update_peak(reader.session(self.entries[self.session_i]['path']))
+        except OSError:
+            self.status.config(text='Data file busy, try again.')
+            return
+        self._blit()
+
+    def step_peak(self, step):
+        self.show_peak(self.peak_i + step)
+
+    def step_session(self, step):
+        i = min(max(self.session_i + step, 0), len(self.entries) - 1)
+        if i != self.session_i:
+            self.show_session(i)
+
+    def _click(self, event):
+        # Clicking the overview jumps to the nearest following peak
+        zooming = self.canvas.toolbar is not None and self.canvas.toolbar.mode
+        if event.inaxes is self.ax_all and len(self.peaks) and not zooming:
+            self.show_peak(peak_near(self.peaks, event.xdata))
+
+    def save_entry(self):
+        '''Store the labels of the current peak in the session's index.'''
+        if len(self.peaks) == 0:
+            return
+        self.peaks[self.peak_i]['hold'] = self.hold_choice.get()
+        self.peaks[self.peak_i]['valid'] = self.valid_choice.get()
+        if not self.writable:
+            self.status.config(text='Read only, labels not saved.')
+            return
+        if self.write_peaks(self.entries[self.session_i]['path'], self.peaks):
+            self.status.config(text=f'Saved peak {self.peak_i + 1}.')
+        else:
+            self.status.config(text='Data file busy, labels kept, save again later.')
+
+
+if __name__ == '__main__':
+    data_file = sys.argv[1] if len(sys.argv) > 1 else './recorded_data.hdf5'
+    window = tk.Tk()
+    window.title('Session browser')
+    browser = SessionBrowser(window, data_file)
+    window.mainloop()
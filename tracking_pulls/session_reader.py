@@ -0,0 +1,126 @@
+import os
+
+import numpy as np
+import h5py as hp
+
+from analysis import load_summary
+
+
+class UniformTimes:
+    '''Sliceable stand-in for `tdata` of sessions recorded before device
+    timestamps were saved, generated from the nominal sample rate.'''
+    def __init__(self, n, sample_rate):
+        self.n = n
+        self.sample_rate = sample_rate
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return np.arange(*key.indices(self.n)) / self.sample_rate
+        if key < 0:
+            key += self.n
+        return key / self.sample_rate
+
+
+def _search(tdata, t):
+    '''Index of the first sample at or after time `t`, reading only
+    O(log n) single values from a lazy `tdata`.'''
+    if isinstance(tdata, np.ndarray):
+        return int(np.searchsorted(tdata, t))
+    lo, hi = 0, len(tdata)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if tdata[mid] < t:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+class Session:
+    '''Lazy view of one recorded session.
+
+    `wdata` and `tdata` are the HDF5 datasets themselves, or read-only
+    memory maps of an uncompressed export, so slicing only reads the
+    samples asked for. Nothing is loaded up front.'''
+    def __init__(self, path, grp, export_dir=None):
+        self.path = path
+        self.grp = grp
+        self.attrs = grp.attrs
+        self.wdata = grp['wdata']
+        if 'tdata' in grp:
+            self.tdata = grp['tdata']
+        else:
+            sample_rate = grp.attrs['sample_rate'] if 'sample_rate' in grp.attrs else (
+                grp['sample_rate'][()] if 'sample_rate' in grp else 10)
+            self.tdata = UniformTimes(len(self.wdata), sample_rate)
+
+        if export_dir is not None:
+            exported = export_paths(export_dir, path)
+            if all(os.path.exists(p) for p in exported):
+                wdata = np.load(exported[0], mmap_mode='r')
+                if len(wdata) == len(self.wdata):
+                    self.wdata = wdata
+                    self.tdata = np.load(exported[1], mmap_mode='r')
+
+    def __len__(self):
+        return len(self.wdata)
+
+    def index_range(self, t0=None, t1=None):
+        '''Sample index range covering times t0 <= t < t1.'''
+        start = 0 if t0 is None else _search(self.tdata, t0)
+        stop = len(self) if t1 is None else _search(self.tdata, t1)
+        return start, stop
+
+    def window(self, t0=None, t1=None):
+        '''(tdata, wdata) arrays for times t0 <= t < t1.'''
+        start, stop = self.index_range(t0, t1)
+        return self.tdata[start:stop], self.wdata[start:stop]
+
+    def summary(self):
+        return load_summary(self.grp)
+
+
+def export_paths(export_dir, path):
+    base = os.path.join(export_dir, path.replace('/', '_').replace(':', '-'))
+    return base + '.wdata.npy', base + '.tdata.npy'
+
+
+def export_session(session, export_dir, chunk_size=65536):
+    '''Write a session's samples as uncompressed .npy files that
+    `Session` can memory map, copying one chunk at a time.'''
+    os.makedirs(export_dir, exist_ok=True)
+    for dest, source in zip(export_paths(export_dir, session.path), (session.wdata, session.tdata)):
+        out = np.lib.format.open_memmap(dest, mode='w+', dtype=np.float64, shape=(len(session),))
+        for start in range(0, len(session), chunk_size):
+            out[start:start + chunk_size] = source[start:start + chunk_size]
+        out.flush()
+        del out
+
+
+class SessionReader:
+    '''Open a data file once and hand out lazy `Session` views of it.
+    With `export_dir` set, sessions exported there are memory mapped.'''
+    def __init__(self, data_file, mode='r', export_dir=None):
+        self.hfile = hp.File(data_file, mode)
+        self.export_dir = export_dir
+
+    def session(self, path):
+        return Session(path, self.hfile[path], self.export_dir)
+
+    def sessions(self):
+        for day in self.hfile:
+            for name in self.hfile[day]:
+                if 'wdata' in self.hfile[day][name]:
+                    yield self.session(f'{day}/{name}')
+
+    def close(self):
+        self.hfile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,81 @@
+import time
+
+import numpy as np
+import h5py as hp
+
+from catalog import session_entry
+from analysis import write_summary
+from segmentation import write_reps
+
+
+class SessionWriter:
+    '''Record a session to HDF5 while it is being acquired.
+
+    The group and its chunked, resizable `tdata`, `wdata` and `time_ms`
+    datasets are created up front and batches are appended as they
+    arrive. The file is flushed every `flush_interval` seconds, so a crash
+    loses at most that much data. The group's `complete` attribute stays
+    False until `close(complete=True)`, which also stores the summary
+    metrics and the table of reps. If a `Catalog` is given the session is added to it on close.'''
+    def __init__(self, path, group_name, attrs=None, chunk_size=4096,
+                 compression='gzip', flush_interval=5, catalog=None):
+        self.group_name = group_name
+        self.catalog = catalog
+        self.hfile = hp.File(path, 'a')
+        self.grp = self.hfile.create_group(group_name)
+        for key, value in (attrs or {}).items():
+            self.grp.attrs[key] = value
+        self.grp.attrs['complete'] = False
+        self.grp.attrs['start_time'] = time.time()
+
+        self.datasets = {}
+        for name, dtype in (('tdata', np.float64), ('wdata', np.float64), ('time_ms', np.int64)):
+            self.datasets[name] = self.grp.create_dataset(
+                name, shape=(0,), maxshape=(None,), dtype=dtype,
+                chunks=(chunk_size,), compression=compression,
+            )
+        self.n = 0
+        self.summary = None
+        self.reps = None
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def append(self, t, w, ms):
+        '''Append a batch of samples.'''
+        n = len(t)
+        if n == 0:
+            return
+        for name, values in (('tdata', t), ('wdata', w), ('time_ms', ms)):
+            dset = self.datasets[name]
+            dset.resize((self.n + n,))
+            dset[self.n:] = values
+        self.n += n
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self.grp.attrs['n_samples'] = self.n
+        self.hfile.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self, complete=True, attrs=None):
+        '''Write final attributes and close the file.'''
+        if not self.hfile:
+            return
+        for key, value in (attrs or {}).items():
+            self.grp.attrs[key] = value
+        self.grp.attrs['n_samples'] = self.n
+        self.grp.attrs['complete'] = complete
+        # Reps first, the summary looks for the pull within them
+        self.reps = write_reps(self.grp)
+        self.summary = write_summary(self.grp)
+        entry = session_entry(self.group_name, self.grp)
+        self.hfile.close()
+        if self.catalog is not None:
+            self.catalog.add(entry)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
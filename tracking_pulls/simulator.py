@@ -0,0 +1,247 @@
+import os
+import time
+import tty
+import select
+import threading
+
+import numpy as np
+
+from parsing import SYNC, PACKET
+
+# Command bytes understood by scale_readout.ino
+HANDSHAKE = 0
+WEIGHT_REQUEST = 1
+ON_REQUEST = 2
+STREAM = 3
+READ_DAQ_DELAY = 4
+TARE = 5
+STREAM_BINARY = 6
+
+
+def repeaters(on=7, off=3, peak=40, ramp=0.3, start=2):
+    '''Pull profile for repeaters: `on` seconds at `peak` kg, `off`
+    seconds of rest, with linear ramps of `ramp` seconds.'''
+    def profile(t):
+        phase = (np.asarray(t) - start) % (on + off)
+        rise = np.clip(phase / ramp, 0, 1)
+        fall = np.clip((on - phase) / ramp, 0, 1)
+        return np.where(np.asarray(t) >= start, peak * np.minimum(rise, fall), 0.0)
+    return profile
+
+
+class SimulatedScale:
+    '''Software stand-in for an Arduino running `scale_readout.ino`.
+
+    It behaves like an open `serial.Serial` (read, read_until, read_all,
+    write, in_waiting, timeout, open/close) and answers the same commands
+    as the firmware. Samples are produced on demand from a simulated clock
+    that runs `speed` times faster than real time, using `profile(t)` plus
+    Gaussian `noise`. `sample_rate` overrides the READ_DAQ_DELAY interval
+    for rates real hardware cannot reach, and a fraction `corrupt` of the
+    lines/packets is mangled on purpose.'''
+    def __init__(self, profile=None, noise=0.05, sample_rate=None, speed=1.0,
+                 corrupt=0.0, boot_time=0.0, timeout=None, seed=None):
+        self.profile = profile if profile is not None else repeaters()
+        self.noise = noise
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.corrupt = corrupt
+        self.boot_time = boot_time
+        self.timeout = timeout
+        self.rng = np.random.default_rng(seed)
+        # The reader thread and the main thread may use the port together
+        self._lock = threading.RLock()
+        self.is_open = False
+        self.open()
+
+    def open(self):
+        '''Opening the port resets the board, as with a real Arduino.'''
+        self.is_open = True
+        self.t_start = time.perf_counter()
+        self.out = bytearray()
+        self.commands = bytearray()
+        self.mode = ON_REQUEST
+        self.delay_ms = 100
+        self.n_sent = 0
+        self.seq = 0
+        self.offset = 0.0
+        self.booted = False
+
+    def close(self):
+        self.is_open = False
+
+    def millis(self):
+        return (time.perf_counter() - self.t_start) * 1000 * self.speed
+
+    def interval_ms(self):
+        if self.sample_rate is not None:
+            return 1000 / self.sample_rate
+        return max(self.delay_ms, 1)
+
+    def weights(self, t_ms):
+        t = np.asarray(t_ms) / 1000
+        return self.profile(t) + self.rng.normal(scale=self.noise, size=np.shape(t)) - self.offset
+
+    def _println(self, text):
+        self.out += text.encode() + b'\r\n'
+
+    def _emit(self, t_ms, w):
+        '''Queue samples in the current stream format.'''
+        if self.mode == STREAM_BINARY:
+            packets = np.zeros(len(t_ms), dtype=PACKET)
+            packets['sync'] = list(SYNC)
+            packets['seq'] = (self.seq + np.arange(len(t_ms))) % 65536
+            packets['time_ms'] = t_ms
+            packets['weight'] = w
+            raw = packets.view(np.uint8).reshape(len(t_ms), PACKET.itemsize)
+            raw[:, -1] = raw[:, 2:-1].sum(axis=1, dtype=np.uint8)
+            if self.corrupt:
+                bad = np.flatnonzero(self.rng.random(len(t_ms)) < self.corrupt)
+                raw[bad, self.rng.integers(2, PACKET.itemsize, len(bad))] ^= 0xFF
+            self.seq = (self.seq + len(t_ms)) % 65536
+            self.out += raw.tobytes()
+            return
+        lines = [f'{t},{v:.2f}' for t, v in zip(t_ms.tolist(), w.tolist())]
+        if self.corrupt:
+            for i in np.flatnonzero(self.rng.random(len(lines)) < self.corrupt):
+                lines[i] = lines[i][:len(lines[i]) // 2] + '#'
+        self.out += ('\r\n'.join(lines) + '\r\n').encode()
+
+    def _step(self):
+        '''Advance the simulated board up to the current time.'''
+        now = self.millis()
+        if not self.booted:
+            if now < self.boot_time * 1000:
+                return
+            self._println("Setting up scale for use...")
+            self._println("Scale tared and set to zero. Ready to be called.")
+            self.booted = True
+        self._handle_commands()
+        if self.mode in (STREAM, STREAM_BINARY):
+            t_ms, w = self.due(now)
+            if len(t_ms):
+                self._emit(t_ms, w)
+                self.n_sent += len(t_ms)
+
+    def due(self, now):
+        '''Stream samples that fell due by device time `now`, as (time in
+        ms, weight) arrays.'''
+        interval = self.interval_ms()
+        n_due = int((now - self.stream_start) // interval) + 1 - self.n_sent
+        if n_due <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        t_ms = (self.stream_start + (self.n_sent + np.arange(n_due)) * interval).astype(np.int64)
+        return t_ms, self.weights(t_ms)
+
+    def start_stream(self):
+        self.stream_start = self.millis()
+        self.n_sent = 0
+        self.seq = 0
+
+    def _handle_commands(self):
+        while self.commands:
+            command = self.commands[0]
+            if command == READ_DAQ_DELAY:
+                end = self.commands.find(b'x')
+                if end < 0:
+                    return
+                self.delay_ms = int(self.commands[1:end] or 0)
+                del self.commands[:end + 1]
+                continue
+            del self.commands[:1]
+            if command == HANDSHAKE:
+                self._println("Message received.")
+            elif command == WEIGHT_REQUEST:
+                t_ms = np.array([int(self.millis())])
+                w = self.weights(t_ms)
+                self._println(f'{t_ms[0]},{w[0]:.2f}')
+            elif command == ON_REQUEST:
+                self.mode = ON_REQUEST
+            elif command in (STREAM, STREAM_BINARY):
+                self.mode = command
+                self.start_stream()
+            elif command == TARE:
+                self.offset += self.weights(np.array([self.millis()]))[0]
+                self._println("Tare done.")
+
+    # Serial interface
+
+    def write(self, data):
+        with self._lock:
+            self.commands += data
+            self._step()
+        return len(data)
+
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._step()
+            return len(self.out)
+
+    def _take(self, ready, end):
+        '''Block until `ready()` or the timeout expires, like pyserial,
+        then remove and return the first `end()` bytes.'''
+        deadline = None if self.timeout is None else time.perf_counter() + self.timeout
+        while True:
+            with self._lock:
+                self._step()
+                if ready() or (deadline is not None and time.perf_counter() >= deadline):
+                    n = end()
+                    data = bytes(self.out[:n])
+                    del self.out[:n]
+                    return data
+            time.sleep(0.001)
+
+    def read(self, size=1):
+        return self._take(lambda: len(self.out) >= size, lambda: size)
+
+    def read_until(self, expected=b'\n'):
+        def end():
+            i = self.out.find(expected)
+            return len(self.out) if i < 0 else i + len(expected)
+        return self._take(lambda: expected in self.out, end)
+
+    def read_all(self):
+        with self._lock:
+            self._step()
+            data = bytes(self.out)
+            self.out.clear()
+        return data
+
+
+def serve_pty(device, poll_interval=0.001):
+    '''Expose `device` on a pseudo terminal, so code that opens a real
+    port with `serial.Serial(path)` can talk to it. Returns the path and
+    the serving thread, which stops when the path is closed.'''
+    master, slave = os.openpty()
+    # Raw mode, so command bytes are not taken as control characters
+    tty.setraw(slave)
+    path = os.ttyname(slave)
+
+    def serve():
+        while device.is_open:
+            readable, _, _ = select.select([master], [], [], poll_interval)
+            if readable:
+                try:
+                    device.write(os.read(master, 1024))
+                except OSError:
+                    break
+            data = device.read_all()
+            if data:
+                os.write(master, data)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    return path, thread
+
+
+if __name__ == '__main__':
+    import sys
+    # Serve a simulated board until interrupted, e.g. `python simulator.py 1000`
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else None
+    path, thread = serve_pty(SimulatedScale(sample_rate=rate))
+    print(f'Simulated scale on {path}')
+    try:
+        thread.join()
+    except KeyboardInterrupt:
+        pass